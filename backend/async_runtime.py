@@ -0,0 +1,49 @@
+import asyncio
+import os
+import threading
+
+# Upper bound on agent/model requests in flight at once across the process
+MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", 16))
+
+_lock = threading.Lock()
+_loop = None
+_semaphore = None
+
+
+def get_loop():
+    """
+    The process-wide event loop, running on a daemon thread. Every async agent
+    call is scheduled here so Streamlit script threads never own a loop.
+    """
+    global _loop, _semaphore
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="agent-loop", daemon=True).start()
+            _semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+            _loop = loop
+        return _loop
+
+
+def submit(coro):
+    """Schedule `coro` on the shared loop and return a concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro, timeout=None):
+    """Run `coro` on the shared loop and block the calling thread for its result."""
+    return submit(coro).result(timeout)
+
+
+async def limited(coro):
+    """Await `coro` while holding one of the MAX_CONCURRENCY slots."""
+    get_loop()
+    async with _semaphore:
+        return await coro
+
+
+def gather(*coros, timeout=None):
+    """Run independent coroutines concurrently and return their results in order."""
+    async def _gather():
+        return await asyncio.gather(*coros)
+    return run(_gather(), timeout)
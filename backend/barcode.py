@@ -0,0 +1,96 @@
+import re
+
+from .ndc_index import lookup_ndc
+
+# Optional: pyzbar needs the zbar shared library. Without it every scan goes
+# to the vision model as before.
+try:
+    from pyzbar.pyzbar import decode as _zbar_decode
+except (ImportError, OSError):
+    _zbar_decode = None
+
+# Largest edge handed to the decoder; bigger photos only slow zbar down
+DECODE_MAX_EDGE = 2000
+
+_GS1_SEPARATOR = "\x1d"
+
+
+def available():
+    return _zbar_decode is not None
+
+
+def decode(image):
+    """[(symbology, data)] for every barcode zbar finds in a PIL image."""
+    if _zbar_decode is None:
+        return []
+    image = image.convert("L")
+    image.thumbnail((DECODE_MAX_EDGE, DECODE_MAX_EDGE))
+    return [(symbol.type, symbol.data.decode("ascii", "ignore")) for symbol in _zbar_decode(image)]
+
+
+def _gs1_fields(data):
+    """Application identifiers of a GS1-128 string: GTIN (01) and expiry (17)."""
+    data = data.lstrip(_GS1_SEPARATOR).replace("]C1", "")
+    fields, pos = {}, 0
+    while pos + 2 <= len(data):
+        ai = data[pos:pos + 2]
+        if ai == "01":
+            fields["gtin"], pos = data[pos + 2:pos + 16], pos + 16
+        elif ai == "17":
+            fields["expiry"], pos = data[pos + 2:pos + 8], pos + 8
+        else:
+            break
+    return fields
+
+
+def ndc_from_barcode(data):
+    """
+    The 10-digit NDC carried by a pharmaceutical UPC-A, EAN-13 or GTIN-14
+    (GS1-128) code, or None. Drug UPCs use number system 3 followed by the
+    NDC digits and a check digit.
+    """
+    digits = re.sub(r"\D", "", data)
+    if len(data) > 14 and data.lstrip(_GS1_SEPARATOR).startswith("01"):
+        digits = _gs1_fields(data).get("gtin", "")
+    if len(digits) == 12 and digits[0] == "3":
+        return digits[1:11]
+    if len(digits) == 13 and digits.startswith("03"):
+        return digits[2:12]
+    if len(digits) == 14 and digits[1:3] == "03":
+        return digits[3:13]
+    return None
+
+
+def product_from_image(image):
+    """
+    Extractor-shaped result for the first barcode in `image` that resolves
+    through the local NDC index, or None so the caller can fall back to the
+    vision model.
+    """
+    return product_from_symbols(decode(image))
+
+
+def product_from_symbols(symbols):
+    """product_from_image() for barcodes already decoded with decode()."""
+    for symbology, data in symbols:
+        ndc = ndc_from_barcode(data)
+        product = lookup_ndc(ndc) if ndc else None
+        if product is None:
+            continue
+        expiry = _gs1_fields(data).get("expiry") if symbology in ("CODE128", "DATABAR", "DATABAR_EXP") else None
+        return {
+            "brand_name": product["brand_name"],
+            "generic_name": product["generic_name"],
+            "ingredients": product["ingredients"],
+            "manufacturer": product["manufacturer"],
+            "dosage_instructions": None,
+            "warnings": None,
+            "expiration_date": f"20{expiry[:2]}-{expiry[2:4]}-{expiry[4:6]}" if expiry and len(expiry) == 6 else None,
+            "ndc_code": product.get("package_ndc") or product["product_ndc"],
+            "barcode": data,
+            "bounding_box": None,
+            "image_url": None,
+            "feedback": f"Resolved locally from the {symbology} barcode via the FDA NDC Directory.",
+            "fda_ndc": product,
+        }
+    return None
@@ -1,88 +1,280 @@
-import json
+import os
+from datetime import datetime, time
+from .journal_store import JournalStore
+from .profile_cache import ProfileCache
+from .history_query import DateIndex
+from .search_index import SearchIndex
+from .vitals import build_vitals
+
+def _make_store():
+    """Pick the storage backend from ALETHEIA_STORAGE ("journal" or "sqlite")."""
+    backend = os.getenv("ALETHEIA_STORAGE", "journal").lower()
+    if backend == "sqlite":
+        from .sqlite_store import SQLiteStore
+        return SQLiteStore(os.getenv("ALETHEIA_DB_PATH", "users/aletheia.db"), legacy_root="users")
+    if backend != "journal":
+        raise ValueError(f"Unknown ALETHEIA_STORAGE backend: {backend}")
+    return JournalStore("users")
+
+_store = _make_store()
+_cache = ProfileCache(_store)
+_search = SearchIndex(os.getenv("ALETHEIA_SEARCH_DB", "users/search_index.db"))
+# Set once search_all() has indexed the users already on disk
+_backfilled = False
+# Users whose index update failed after a write; reindexed on the next search
+_stale = set()
+
+def _append(name, pairs):
+    _store.append(name, pairs)
+    _cache.bump(name)
+    # The write is already durable; a failing search index must not undo it.
+    try:
+        if not _search.is_indexed(name):
+            # First write since the index was created: index the whole profile,
+            # which already includes the entries just written.
+            _search.reindex(name, _cache.get(name))
+        else:
+            ts = datetime.now().isoformat()
+            _search.add(name, [(field, value, ts) for field, value in pairs])
+    except Exception as e:
+        print(f"❌ Search index update failed for {name}, will reindex on next search: {e}")
+        _stale.add(name)
+        try:
+            _search.forget(name)
+        except Exception:
+            pass
+
+def _reindex(name):
+    _stale.discard(name)
+    _search.reindex(name, _cache.get(name))
+
+def search(name, query, limit=50):
+    """
+    Find a user's history entries and doctor notes containing every word of
+    `query`, newest first.
+    """
+    if name in _stale or not _search.is_indexed(name):
+        _reindex(name)
+    return _search.search(query, name=name, limit=limit)
+
+def search_all(query, limit=50):
+    """
+    Search history entries and doctor notes across every user. Users on disk
+    that were never indexed are indexed on the first call, and users whose
+    index update failed on every call until it succeeds.
+    """
+    global _backfilled
+    for name in list(_stale):
+        _reindex(name)
+    if not _backfilled:
+        indexed = _search.indexed_users()
+        for name in _store.users():
+            if name not in indexed:
+                _reindex(name)
+        _backfilled = True
+    return _search.search(query, limit=limit)
+
+def rebuild_search_index():
+    """
+    Re-index every user on disk, e.g. after restoring profiles from backup.
+    """
+    for name in _store.users():
+        _search.reindex(name, _cache.get(name))
+
+def profile_version(name):
+    """
+    Return a counter that changes whenever the user's profile changes.
+    """
+    return _cache.version(name)
+
+def read_profile(name):
+    """
+    Read the full profile view (history, notes, vitals and medications).
+    """
+    return _cache.get(name)
+
+def compact_profile(name):
+    """
+    Fold a user's journal back into their JSON snapshot.
+    """
+    _store.compact(name)
+    _cache.bump(name)
+
+def read_tail(name, field, n):
+    """
+    Read the newest `n` entries of a profile field, oldest first, without
+    loading the full profile.
+    """
+    data = _cache.peek(name)
+    if data is not None:
+        return data[field][-n:] if n > 0 else []
+    return _store.tail(name, field, n)
+
+def read_latest_medical_history(name):
+    """
+    Read the most recent medical history entry, or None.
+    """
+    entries = read_tail(name, "medical_history", 1)
+    return entries[0] if entries else None
+
+def read_latest_doctor_note(name):
+    """
+    Read the most recent doctor's note, or None.
+    """
+    notes = read_tail(name, "doctor_notes", 1)
+    return notes[0] if notes else None
+
+def read_page(name, field, cursor=None, limit=20, start=None, end=None):
+    """
+    Read one page of a history, notes or vitals field, oldest first.
+
+    `start`/`end` restrict the page to entries dated within that range
+    ("2023", "2023-04" and full ISO dates are accepted). Returns
+    (entries, next_cursor); pass next_cursor back to get the following page,
+    it is None on the last page.
+    """
+    page = getattr(_store, "page", None)
+    if page is not None:
+        return page(name, field, cursor, limit, start, end)
+    index = _cache.derived(name, "date_index", DateIndex)
+    return index.page(field, cursor, limit, start, end)
+
+def read_vitals(name):
+    """
+    Read bmi/height/bp as columnar VitalSeries, parsed once per profile change.
+    """
+    return _cache.derived(name, "vitals", build_vitals)
+
+def read_vitals_chart(name, max_points=None):
+    """
+    Read vitals downsampled with LTTB to at most `max_points` per chart
+    (ALETHEIA_CHART_POINTS, default 500), computed once per profile change.
+    """
+    max_points = max_points or int(os.getenv("ALETHEIA_CHART_POINTS", "500"))
+    return _cache.derived(
+        name,
+        ("vitals_chart", max_points),
+        lambda profile: {field: series.downsample(max_points) for field, series in read_vitals(name).items()},
+    )
 
 def read_medical_history(name):
     """
-    Write the medical history to a file.
+    Read the medical history from a file.
     """
-    with open(f'users/{name}.json', 'r') as f:
-        data = json.load(f)
-    return data["medical_history"]
+    return _cache.get(name)["medical_history"]
 
 def write_medical_history(name, new_info):
     """
-    Read the medical history from a file.
+    Append an entry to the medical history.
     """
-    with open(f'users/{name}.json', 'r') as f:
-        data = json.load(f)
-    data["medical_history"].append(new_info)
-    with open(f'users/{name}.json', 'w') as f:
-        json.dump(data, f, indent=0)
-    
+    _append(name, [("medical_history", new_info)])
+
 def append_doctor_notes(name, new_doctor_notes):
     """
     Append the doctor's notes to a file.
     """
-    with open(f'users/{name}.json', 'r') as f:
-        data = json.load(f)
-    data["doctor_notes"].append(new_doctor_notes)
-    with open(f'users/{name}.json', 'w') as f:
-        json.dump(data, f, indent=0)
+    _append(name, [("doctor_notes", new_doctor_notes)])
 
 def read_doctor_notes(name):
     """
     Read the doctor's notes from a file.
     """
-    with open(f'users/{name}.json', 'r') as f:
-        data = json.load(f)
-    return data["doctor_notes"]
+    return _cache.get(name)["doctor_notes"]
 
-def append_user_stats(name, bmi, height, bp):
-    with open(f'users/{name}.json', 'r') as f:
-        data = json.load(f)
-    # Ensure the keys exist
-    if 'bmi' not in data:
-        data['bmi'] = []
-    if 'height' not in data:
-        data['height'] = []
-    if 'bp' not in data:
-        data['bp'] = []
+def _stats_pairs(bmi, height, bp):
     # Only append if values are not empty
-    if bmi:
-        data['bmi'].append(bmi)
-    if height:
-        data['height'].append(height)
-    if bp:
-        data['bp'].append(bp)
-    with open(f'users/{name}.json', 'w') as f:
-        json.dump(data, f, indent=0)
+    return [(field, value) for field, value in (("bmi", bmi), ("height", height), ("bp", bp)) if value]
+
+def append_user_stats(name, bmi, height, bp):
+    _append(name, _stats_pairs(bmi, height, bp))
 
 def read_user_stats(name):
-    with open(f'users/{name}.json', 'r') as f:
-        data = json.load(f)
+    data = _cache.get(name)
     return data['bmi'], data['height'], data['bp']
 
+def _medication_pairs(medication, medication_time):
+    if not medication:
+        return []
+    # Convert time object to string if needed
+    if isinstance(medication_time, time):
+        med_time_str = medication_time.strftime("%H:%M")
+    else:
+        med_time_str = str(medication_time)
+    return [("medications", medication), ("medication_times", med_time_str)]
+
 def append_medication(name, medication, medication_time):
-    with open(f'users/{name}.json', 'r') as f:
-        data = json.load(f)
-    if 'medications' not in data:
-        data['medications'] = []
-    if 'medication_times' not in data:
-        data['medication_times'] = []
-    if medication:
-        data['medications'].append(medication)
-        data['medication_times'].append(medication_time)
-    if medication:
-        # Convert time object to string if needed
-        if isinstance(medication_time, time):
-            med_time_str = medication_time.strftime("%H:%M")
-        else:
-            med_time_str = str(medication_time)
-        data['medications'].append(medication)
-        data['medication_times'].append(med_time_str)
-    with open(f'users/{name}.json', 'w') as f:
-        json.dump(data, f, indent=0)
+    _append(name, _medication_pairs(medication, medication_time))
 
 def read_user_medications(name):
-    with open(f'users/{name}.json', 'r') as f:
-        data = json.load(f)
-    return data['medications']
\ No newline at end of file
+    return _cache.get(name)['medications']
+
+class ProfileBatch:
+    """
+    Unit of work for one user: collects mutations and applies them all in a
+    single journal line or a single SQLite transaction on commit().
+
+    Used as a context manager, it commits on a clean exit and discards the
+    pending mutations if the block raises.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.pairs = []
+
+    def write_medical_history(self, new_info):
+        self.pairs.append(("medical_history", new_info))
+
+    def append_doctor_notes(self, new_doctor_notes):
+        self.pairs.append(("doctor_notes", new_doctor_notes))
+
+    def append_user_stats(self, bmi, height, bp):
+        self.pairs.extend(_stats_pairs(bmi, height, bp))
+
+    def append_medication(self, medication, medication_time):
+        self.pairs.extend(_medication_pairs(medication, medication_time))
+
+    def commit(self):
+        pairs, self.pairs = self.pairs, []
+        if pairs:
+            _append(self.name, pairs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.pairs = []
+        return False
+
+def profile_batch(name):
+    """
+    Start a batch of profile mutations for `name`.
+    """
+    return ProfileBatch(name)
+
+__all__ = [
+    "ProfileBatch",
+    "profile_batch",
+    "read_profile",
+    "compact_profile",
+    "profile_version",
+    "read_tail",
+    "read_latest_medical_history",
+    "read_latest_doctor_note",
+    "read_page",
+    "search",
+    "search_all",
+    "rebuild_search_index",
+    "read_medical_history",
+    "write_medical_history",
+    "append_doctor_notes",
+    "read_doctor_notes",
+    "append_user_stats",
+    "read_user_stats",
+    "read_vitals",
+    "read_vitals_chart",
+    "append_medication",
+    "read_user_medications",
+]
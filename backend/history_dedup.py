@@ -0,0 +1,52 @@
+import hashlib
+import json
+
+# Marker replacing a deduplicated sub-record inside a stored history entry.
+REF_KEY = "$ref"
+
+
+def content_hash(value):
+    """SHA-256 of the canonical JSON encoding of `value`."""
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _is_ref(value):
+    return isinstance(value, dict) and len(value) == 1 and REF_KEY in value
+
+
+def split_entry(entry):
+    """
+    Replace every dict/list sub-record of a history entry with a content
+    reference. Returns (entry_with_refs, {hash: sub_record}).
+    Entries that are not dicts (free-text history lines) are stored as-is.
+    """
+    if not isinstance(entry, dict):
+        return entry, {}
+    compact = {}
+    blobs = {}
+    for key, value in entry.items():
+        if isinstance(value, (dict, list)) and value and not _is_ref(value):
+            digest = content_hash(value)
+            blobs[digest] = value
+            compact[key] = {REF_KEY: digest}
+        else:
+            compact[key] = value
+    return compact, blobs
+
+
+def entry_refs(entry):
+    """Hashes referenced by a stored history entry."""
+    if not isinstance(entry, dict):
+        return []
+    return [value[REF_KEY] for value in entry.values() if _is_ref(value)]
+
+
+def expand_entry(entry, blobs):
+    """
+    Rebuild the original history entry from its stored form.
+    Sub-records are shared between entries, so treat the result as read-only.
+    """
+    if not isinstance(entry, dict):
+        return entry
+    return {key: blobs[value[REF_KEY]] if _is_ref(value) else value for key, value in entry.items()}
@@ -0,0 +1,94 @@
+import re
+from bisect import bisect_left, bisect_right
+
+# Keys inside a medical history entry that carry an event date, e.g.
+# medical_conditions[].date, patient_information.last_visit,
+# recent_visits[].date or medical_conditions[].diagnosed.
+DATE_KEYS = {"date", "last_visit", "diagnosed", "last_physical", "visit_date"}
+
+PAGED_FIELDS = ("medical_history", "doctor_notes", "bmi", "height", "bp")
+
+_DATE_RE = re.compile(r"^\s*(\d{4})(?:-(\d{2})(?:-(\d{2}))?)?")
+
+
+def normalize_date(value, upper=False):
+    """
+    Normalise "2023", "2023-04" or an ISO date/timestamp to "YYYY-MM-DD".
+    Partial dates expand to the start of the period, or to its end when
+    `upper` is set (so "2024" as an upper bound covers all of 2024).
+    Returns None for anything that does not start with a year.
+    """
+    if not isinstance(value, str):
+        return None
+    match = _DATE_RE.match(value)
+    if not match:
+        return None
+    year, month, day = match.groups()
+    if month is None:
+        month, day = ("12", "31") if upper else ("01", "01")
+    elif day is None:
+        day = "31" if upper else "01"
+    return f"{year}-{month}-{day}"
+
+
+def _walk_dates(value, dates):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in DATE_KEYS and isinstance(item, str):
+                date = normalize_date(item)
+                if date:
+                    dates.add(date)
+            else:
+                _walk_dates(item, dates)
+    elif isinstance(value, list):
+        for item in value:
+            _walk_dates(item, dates)
+
+
+def entry_dates(field, entry, ts=None):
+    """
+    Every date an entry should be found under. History entries are indexed by
+    the event dates they contain; everything else (and history entries with
+    no dates) by their write timestamp.
+    """
+    dates = set()
+    if field == "medical_history":
+        _walk_dates(entry, dates)
+    if not dates and ts:
+        dates.add(normalize_date(ts))
+    return dates
+
+
+class DateIndex:
+    """Sorted (date, position) index over the dated fields of one profile."""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.dates = {}
+        timestamps = profile.get("timestamps", {})
+        for field in PAGED_FIELDS:
+            stamps = timestamps.get(field, [])
+            pairs = []
+            for pos, entry in enumerate(profile[field]):
+                ts = stamps[pos] if pos < len(stamps) else None
+                pairs.extend((date, pos) for date in entry_dates(field, entry, ts))
+            pairs.sort()
+            self.dates[field] = pairs
+
+    def page(self, field, cursor=None, limit=20, start=None, end=None):
+        """
+        Return (entries, next_cursor) for entries at positions >= cursor,
+        optionally restricted to dates within [start, end].
+        """
+        entries = self.profile[field]
+        cursor = cursor or 0
+        if start is None and end is None:
+            positions = range(cursor, len(entries))
+        else:
+            pairs = self.dates[field]
+            lo = bisect_left(pairs, (normalize_date(start) or "",)) if start else 0
+            hi = bisect_right(pairs, (normalize_date(end, upper=True) or "9999", len(entries))) if end else len(pairs)
+            positions = sorted({pos for _, pos in pairs[lo:hi] if pos >= cursor})
+        selected = list(positions[:limit + 1])
+        next_cursor = selected[limit] if len(selected) > limit else None
+        return [entries[pos] for pos in selected[:limit]], next_cursor
@@ -1,8 +1,17 @@
+import asyncio
 import os
 import json
 import re
+import glob
+import hashlib
+import threading
+from datetime import datetime
 import google.generativeai as genai
 from dotenv import load_dotenv
+from .response_cache import ResponseCache, normalize_key
+from .rate_limit import generate, generate_async
+from .registry import gemini_model
+from .single_flight import single_flight
 
 # Set up API key
 load_dotenv()
@@ -14,12 +23,92 @@ import dotenv
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 
-# Initialize model once
-model = genai.GenerativeModel('gemini-2.5-flash')
+# Shared with every other gemini-2.5-flash caller
+model = gemini_model('gemini-2.5-flash')
 
 insurance_query = None
 context = None
 
+RESULTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Analyses are reused for INSURANCE_CACHE_TTL seconds (default one week)
+analysis_cache = ResponseCache(
+    "insurance_analysis",
+    ttl=float(os.getenv("INSURANCE_CACHE_TTL", 7 * 24 * 3600)),
+    max_entries=int(os.getenv("INSURANCE_CACHE_SIZE", 500)),
+)
+_warm_lock = threading.Lock()
+_warm_loaded = False
+
+def build_context(provider: str) -> str:
+    """The user context the dashboard sends with every provider analysis."""
+    return (
+        f"User is requesting analysis for {provider} insurance company. "
+        "User is a 32-year-old freelance graphic designer living in Los Angeles, earning "
+        "≈ $85k/year pre-tax with irregular cash-flow, mild asthma, type-2 diabetes family "
+        "history, newly married and planning children in ≤ 3 yrs. Needs PPO that covers "
+        "Cedars-Sinai + UCLA, strong maternity, fears high deductibles after a $4k ER bill, "
+        "values ESG & companies with clean denial records, wants first-class mobile app, "
+        "travels abroad ~6×/yr. Please analyze specifically {provider} and provide alternatives."
+    )
+
+def context_hash(context: str, insurance_query: str = "") -> str:
+    """
+    Hash of the user context with whitespace collapsed and the provider's
+    name blanked out, so the same context for "Aetna", "aetna" or "Aetna "
+    shares one key.
+    """
+    name = re.sub(r"\s+", " ", insurance_query).strip()
+    context = re.sub(r"\s+", " ", context).strip()
+    if name:
+        context = re.sub(re.escape(name), "{provider}", context, flags=re.I)
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()[:16]
+
+def cache_key(insurance_query: str, context: str) -> str:
+    return f"{normalize_key(insurance_query)}|{context_hash(context, insurance_query)}"
+
+def warm_cache():
+    """
+    Seed the analysis cache from saved insurance_analysis_*.json results that
+    are still inside the freshness window. Files written before context
+    hashes were recorded are assumed to use build_context(provider).
+    """
+    global _warm_loaded
+    with _warm_lock:
+        if _warm_loaded:
+            return
+        _warm_loaded = True
+        now = datetime.now().timestamp()
+        for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "insurance_analysis_*.json"))):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                created = datetime.fromisoformat(saved["timestamp"]).timestamp()
+                provider = saved["provider"]
+                analysis = saved["analysis"]
+            except (OSError, ValueError, KeyError):
+                continue
+            if analysis_cache.ttl is not None and now - created >= analysis_cache.ttl:
+                continue
+            digest = saved.get("context_hash") or context_hash(build_context(provider), provider)
+            key = f"{normalize_key(provider)}|{digest}"
+            # Files are visited oldest first, so the newest result wins.
+            analysis_cache.set(key, analysis, created=created)
+
+def save_analysis(insurance_query: str, context: str, analysis: dict):
+    """Persist a fresh analysis as a timestamped file and as the latest output."""
+    now = datetime.now()
+    record = {
+        "provider": insurance_query,
+        "timestamp": now.isoformat(),
+        "context_hash": context_hash(context, insurance_query),
+        "analysis": analysis,
+    }
+    filename = f"insurance_analysis_{insurance_query.replace(' ', '_')}_{now.strftime('%Y%m%d_%H%M%S')}.json"
+    for path in (os.path.join(RESULTS_DIR, filename), os.path.join(RESULTS_DIR, "insurance_analysis_output.json")):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=4)
+
 prompt_template = """
 You are an uncompromising insurance-industry intelligence engine.
 
@@ -124,15 +213,7 @@ def extract_json(text: str) -> str:
     text = text.rsplit("```", 1)[0]
     return text.strip()
 
-def analyze_insurance(insurance_query: str, context: str) -> dict:
-    prompt = prompt_template.format(
-        insurance_query=insurance_query,
-        context=context
-    ).strip()
-
-    response = model.generate_content(prompt)
-    raw = response.text
-
+def parse_analysis(raw: str) -> dict:
     # Strip markdown fences, etc.
     json_blob = extract_json(raw)
 
@@ -141,3 +222,47 @@ def analyze_insurance(insurance_query: str, context: str) -> dict:
     except json.JSONDecodeError as e:
         # Throw a clearer error with the blob
         raise ValueError(f"Failed to parse JSON:\n{json_blob}\n\nError: {e}")
+
+@single_flight("analyze_insurance", cache_key)
+def analyze_insurance(insurance_query: str, context: str) -> dict:
+    warm_cache()
+    key = cache_key(insurance_query, context)
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        return cached
+
+    prompt = prompt_template.format(
+        insurance_query=insurance_query,
+        context=context
+    ).strip()
+
+    response = generate(model, prompt)
+    analysis = parse_analysis(response.text)
+
+    analysis_cache.set(key, analysis)
+    save_analysis(insurance_query, context, analysis)
+    return analysis
+
+@single_flight("analyze_insurance", cache_key)
+async def analyze_insurance_async(insurance_query: str, context: str) -> dict:
+    """
+    analyze_insurance() for the shared event loop in backend.async_runtime.
+    Cache and result-file I/O runs in worker threads to keep the loop free.
+    """
+    await asyncio.to_thread(warm_cache)
+    key = cache_key(insurance_query, context)
+    cached = await asyncio.to_thread(analysis_cache.get, key)
+    if cached is not None:
+        return cached
+
+    prompt = prompt_template.format(
+        insurance_query=insurance_query,
+        context=context
+    ).strip()
+
+    response = await generate_async(model, prompt)
+    analysis = parse_analysis(response.text)
+
+    await asyncio.to_thread(analysis_cache.set, key, analysis)
+    await asyncio.to_thread(save_analysis, insurance_query, context, analysis)
+    return analysis
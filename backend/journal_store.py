@@ -0,0 +1,344 @@
+import json
+import os
+import threading
+from datetime import datetime
+from .history_dedup import split_entry, expand_entry
+
+# Every list a profile carries; missing ones are materialised as empty lists.
+# A profile view also has a "timestamps" map holding, per field, the write
+# time of each entry (None for entries that predate the journal).
+PROFILE_FIELDS = (
+    "medical_history",
+    "doctor_notes",
+    "bmi",
+    "height",
+    "bp",
+    "medications",
+    "medication_times",
+)
+
+_GEN_KEY = "_journal_gen"
+
+# Newest entries per field copied into the tail sidecar at compaction
+SNAPSHOT_TAIL = 16
+
+
+class JournalStore:
+    """
+    Per-user append-only JSON-lines journal layered over users/{name}.json.
+
+    The legacy JSON file is treated as a snapshot. Every mutation is appended
+    to users/{name}.jsonl as one line, so a write costs O(new record) instead
+    of O(total history). Readers rebuild the view as snapshot + journal replay.
+
+    Medical history sub-records are content-addressed: each distinct one is
+    written once to users/{name}.blobs.jsonl and history entries only keep
+    references to it.
+
+    Compaction also writes users/{name}.tail.json, holding the snapshot's
+    generation and the newest SNAPSHOT_TAIL entries of each field, so tail
+    reads never have to parse the snapshot.
+    """
+
+    def __init__(self, root="users"):
+        self.root = root
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._blobs = {}
+        self._folded = {}
+
+    def snapshot_path(self, name):
+        return os.path.join(self.root, f"{name}.json")
+
+    def journal_path(self, name):
+        return os.path.join(self.root, f"{name}.jsonl")
+
+    def blobs_path(self, name):
+        return os.path.join(self.root, f"{name}.blobs.jsonl")
+
+    def tail_path(self, name):
+        return os.path.join(self.root, f"{name}.tail.json")
+
+    def lock(self, name):
+        with self._locks_guard:
+            if name not in self._locks:
+                self._locks[name] = threading.RLock()
+            return self._locks[name]
+
+    def users(self):
+        """Names of every user with a snapshot or a journal on disk."""
+        names = set()
+        for entry in os.listdir(self.root) if os.path.isdir(self.root) else []:
+            if entry.endswith((".blobs.jsonl", ".tail.json")):
+                continue
+            stem, ext = os.path.splitext(entry)
+            if ext in (".json", ".jsonl"):
+                names.add(stem)
+        return sorted(names)
+
+    def _read_snapshot(self, name):
+        try:
+            with open(self.snapshot_path(name), 'r') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return {}
+        return json.loads(raw) if raw.strip() else {}
+
+    def _replay(self, name, data, folded_gen):
+        try:
+            f = open(self.journal_path(name), 'r')
+        except FileNotFoundError:
+            return
+        with f:
+            header = f.readline()
+            try:
+                gen = json.loads(header).get("gen", 0)
+            except json.JSONDecodeError:
+                return
+            if gen <= folded_gen:
+                # Already folded into the snapshot by a compaction that was
+                # interrupted before the journal was reset.
+                return
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn trailing line from a crashed writer; skip it.
+                    continue
+                for field, value in record["append"]:
+                    data.setdefault(field, []).append(value)
+                    data["timestamps"].setdefault(field, []).append(record.get("ts"))
+
+    def _read_blobs(self, name):
+        """
+        Return {hash: sub_record} for a user, reading only blob lines appended
+        since the last call.
+        """
+        offset, blobs = self._blobs.get(name, (0, {}))
+        try:
+            with open(self.blobs_path(name), 'rb') as f:
+                f.seek(offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return blobs
+        # Only consume complete lines; a torn tail is retried next time.
+        complete = chunk[:chunk.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            blobs[record["h"]] = record["v"]
+        self._blobs[name] = (offset + len(complete), blobs)
+        return blobs
+
+    def _store_blobs(self, name, entries):
+        """
+        Split history entries into references, persisting any new sub-records
+        before the entries that point at them.
+        """
+        known = self._read_blobs(name)
+        stored = []
+        fresh = {}
+        for entry in entries:
+            compact, blobs = split_entry(entry)
+            stored.append(compact)
+            fresh.update((h, v) for h, v in blobs.items() if h not in known)
+        if fresh:
+            with open(self.blobs_path(name), 'a') as f:
+                f.write("".join(json.dumps({"h": h, "v": v}) + "\n" for h, v in fresh.items()))
+                f.flush()
+                os.fsync(f.fileno())
+        return stored
+
+    def load(self, name):
+        """Rebuild the current profile view from the snapshot and the journal."""
+        with self.lock(name):
+            data = self._read_snapshot(name)
+            folded_gen = data.pop(_GEN_KEY, 0)
+            timestamps = data.setdefault("timestamps", {})
+            for field in PROFILE_FIELDS:
+                data.setdefault(field, [])
+                known = timestamps.get(field, [])
+                timestamps[field] = [None] * (len(data[field]) - len(known)) + known
+            self._replay(name, data, folded_gen)
+            blobs = self._read_blobs(name)
+        data["medical_history"] = [expand_entry(entry, blobs) for entry in data["medical_history"]]
+        return data
+
+    def stamp(self, name):
+        """Cheap change detector: (mtime, size) of the snapshot and journal."""
+        stamp = []
+        for path in (self.snapshot_path(name), self.journal_path(name)):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def read_field(self, name, field):
+        return self.load(name)[field]
+
+    def _journal_gen(self, name):
+        try:
+            with open(self.journal_path(name), 'r') as f:
+                return json.loads(f.readline()).get("gen", 0)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def _lines_backwards(f, block=1 << 16):
+        """Yield the lines of a binary file from last to first."""
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        rest = b""
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + rest).split(b"\n")
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if rest.strip():
+            yield rest
+
+    def tail(self, name, field, n):
+        """
+        Read the newest `n` entries of a field, oldest first.
+
+        The journal is scanned backwards from its end and the scan stops as
+        soon as `n` entries are found; older entries come from the tail
+        sidecar. The snapshot itself is only parsed when `n` exceeds what the
+        sidecar keeps for the field.
+        """
+        if n <= 0:
+            return []
+        with self.lock(name):
+            found = []
+            sidecar = self._snapshot_tail(name)
+            gen = self._journal_gen(name)
+            if gen is not None and gen > sidecar["gen"]:
+                with open(self.journal_path(name), 'rb') as f:
+                    for line in self._lines_backwards(f):
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        found.extend(value for key, value in reversed(record.get("append", [])) if key == field)
+                        if len(found) >= n:
+                            break
+            found = found[:n]
+            if len(found) < n:
+                older = sidecar["tail"].get(field, [])
+                if n - len(found) > len(older) >= SNAPSHOT_TAIL:
+                    older = self._read_snapshot(name).get(field, [])
+                found.extend(reversed(older[-(n - len(found)):]))
+            found.reverse()
+            if field == "medical_history":
+                blobs = self._read_blobs(name)
+                found = [expand_entry(entry, blobs) for entry in found]
+        return found
+
+    def _write_tail(self, name, data, key):
+        sidecar = {
+            "snapshot": key,
+            "gen": data.get(_GEN_KEY, 0),
+            "tail": {field: data.get(field, [])[-SNAPSHOT_TAIL:] for field in PROFILE_FIELDS},
+        }
+        _atomic_write(self.tail_path(name), json.dumps(sidecar))
+        return sidecar
+
+    def _snapshot_tail(self, name):
+        """
+        The tail sidecar of the current snapshot: {"gen", "tail"}. It is tied
+        to the snapshot's (mtime, size); a snapshot without a matching sidecar
+        (written before sidecars existed, or by a compaction that stopped
+        half way) is parsed once and its sidecar written then.
+        """
+        try:
+            st = os.stat(self.snapshot_path(name))
+        except FileNotFoundError:
+            return {"gen": 0, "tail": {}}
+        key = [st.st_mtime_ns, st.st_size]
+        sidecar = self._folded.get(name)
+        if sidecar is not None and sidecar["snapshot"] == key:
+            return sidecar
+        try:
+            with open(self.tail_path(name), 'r') as f:
+                sidecar = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            sidecar = None
+        if sidecar is None or sidecar.get("snapshot") != key:
+            sidecar = self._write_tail(name, self._read_snapshot(name), key)
+        self._folded[name] = sidecar
+        return sidecar
+
+    def _open_journal(self, name):
+        path = self.journal_path(name)
+        try:
+            f = open(path, 'x')
+        except FileExistsError:
+            gen = self._journal_gen(name)
+            folded_gen = self._snapshot_tail(name)["gen"]
+            if gen is not None and gen <= folded_gen:
+                # A compaction stopped after writing the snapshot: finish
+                # resetting the journal, or new lines would be skipped as
+                # already folded.
+                _atomic_write(path, json.dumps({"gen": folded_gen + 1}) + "\n")
+            return open(path, 'a')
+        gen = self._read_snapshot(name).get(_GEN_KEY, 0) + 1
+        f.write(json.dumps({"gen": gen}) + "\n")
+        return f
+
+    def append(self, name, pairs):
+        """
+        Append one journal line holding every (field, value) pair in `pairs`.
+        """
+        pairs = [[field, value] for field, value in pairs]
+        if not pairs:
+            return
+        with self.lock(name):
+            os.makedirs(self.root, exist_ok=True)
+            history = [pair for pair in pairs if pair[0] == "medical_history"]
+            for pair, stored in zip(history, self._store_blobs(name, [pair[1] for pair in history])):
+                pair[1] = stored
+            line = json.dumps({"ts": datetime.now().isoformat(), "append": pairs})
+            with self._open_journal(name) as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def compact(self, name):
+        """
+        Fold the journal back into the JSON snapshot and start a new journal.
+        History entries are written in their deduplicated form.
+        """
+        with self.lock(name):
+            try:
+                with open(self.journal_path(name), 'r') as f:
+                    gen = json.loads(f.readline()).get("gen", 0)
+            except FileNotFoundError:
+                gen = None
+            except json.JSONDecodeError:
+                return
+            folded_gen = self._read_snapshot(name).get(_GEN_KEY, 0)
+            data = self.load(name)
+            data["medical_history"] = self._store_blobs(name, data["medical_history"])
+            data[_GEN_KEY] = folded_gen if gen is None else gen
+            _atomic_write(self.snapshot_path(name), json.dumps(data, indent=0))
+            st = os.stat(self.snapshot_path(name))
+            self._folded[name] = self._write_tail(name, data, [st.st_mtime_ns, st.st_size])
+            if gen is not None:
+                _atomic_write(self.journal_path(name), json.dumps({"gen": gen + 1}) + "\n")
+
+
+def _atomic_write(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
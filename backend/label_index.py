@@ -0,0 +1,164 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import PIL.Image as Image
+
+from .response_cache import cache_dir
+
+# dHash side length: hashes are HASH_SIZE * HASH_SIZE bits
+HASH_SIZE = 16
+LABEL_INDEX_SIZE = int(os.getenv("LABEL_INDEX_SIZE", 5000))
+# Max differing bits (of 256) for two photos to count as the same label.
+# Re-photographing a bottle (small shifts, rotation, re-encoding) moves the
+# hash by roughly 20-30 bits; unrelated labels are around 100 apart.
+LABEL_HASH_THRESHOLD = int(os.getenv("LABEL_HASH_THRESHOLD", 32))
+
+# Set bits per byte value
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS labels (
+    hash BLOB PRIMARY KEY,
+    result TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    content BLOB
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_labels_lru ON labels (accessed);
+CREATE INDEX IF NOT EXISTS idx_labels_content ON labels (content);
+"""
+
+
+def dhash(image, size=HASH_SIZE):
+    """
+    Difference hash of a PIL image as bytes: each bit says whether a pixel of
+    the greyscale (size+1) x size thumbnail is brighter than its right-hand
+    neighbour. Robust to rescaling, re-encoding and small lighting changes.
+    """
+    pixels = np.asarray(image.convert("L").resize((size + 1, size), Image.LANCZOS), dtype=np.int16)
+    return np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes()
+
+
+class LabelIndex:
+    """
+    Persistent, bounded index of label photos already run through the
+    extractor, keyed by dHash.
+
+    A photo whose exact bytes were indexed before is always a match. Other
+    lookups compare the query against every stored hash at once (XOR +
+    popcount over an in-memory matrix, loaded from SQLite on first use) and
+    return the stored extraction of the closest one within `threshold` bits,
+    unless the caller's check rejects it. Beyond `max_entries` the least
+    recently matched labels are evicted. Entries added by other processes are
+    picked up on their next start.
+    """
+
+    def __init__(self, path=None, max_entries=LABEL_INDEX_SIZE, threshold=LABEL_HASH_THRESHOLD):
+        self.path = path or os.path.join(cache_dir(), "label_index.db")
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._keys = None
+        self._matrix = None
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self):
+        # Caller holds self._lock.
+        if self._keys is None:
+            rows = self._connect().execute("SELECT hash FROM labels").fetchall()
+            self._keys = [row[0] for row in rows]
+            self._matrix = np.frombuffer(b"".join(self._keys), dtype=np.uint8).reshape(len(self._keys), -1) \
+                if self._keys else None
+
+    def lookup(self, digest, content=None, confirm=None):
+        """
+        Stored extraction for the label photo, or None. `content` is a digest
+        of the photo's bytes and matches exactly; otherwise the nearest label
+        within the threshold is returned, provided `confirm(result)` (when
+        given) is true.
+        """
+        conn = self._connect()
+        row = None
+        if content is not None:
+            row = conn.execute("SELECT hash, result FROM labels WHERE content = ?", (content,)).fetchone()
+        if row is None:
+            with self._lock:
+                self._load()
+                key = None
+                if self._matrix is not None:
+                    query = np.frombuffer(digest, dtype=np.uint8)
+                    distances = _POPCOUNT[self._matrix ^ query].sum(axis=1)
+                    best = int(np.argmin(distances))
+                    if distances[best] <= self.threshold:
+                        key = self._keys[best]
+            if key is not None:
+                row = conn.execute("SELECT hash, result FROM labels WHERE hash = ?", (key,)).fetchone()
+                if row is not None and confirm is not None and not confirm(json.loads(row[1])):
+                    row = None
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        conn.execute("UPDATE labels SET accessed = ? WHERE hash = ?", (time.time(), row[0]))
+        with self._lock:
+            self.hits += 1
+        return json.loads(row[1])
+
+    def add(self, digest, result, content=None):
+        """Index `result` (the extractor's JSON) under the photo's dHash and content digest."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO labels (hash, result, created, accessed, content) VALUES (?, ?, ?, ?, ?)",
+            (digest, json.dumps(result), now, now, content),
+        )
+        evicted = conn.execute(
+            "DELETE FROM labels WHERE hash IN (SELECT hash FROM labels ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        with self._lock:
+            if evicted or self._keys is None:
+                # Rare: reload rather than patch the matrix row by row.
+                self._keys = None
+                self._load()
+            elif digest not in self._keys:
+                self._keys.append(digest)
+                row = np.frombuffer(digest, dtype=np.uint8)[None, :]
+                self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": 0 if self._keys is None else len(self._keys),
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def label_index():
+    """The process-wide LabelIndex, created on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LabelIndex()
+        return _index
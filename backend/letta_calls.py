@@ -1,21 +1,52 @@
-from pypdf import PdfReader
-from letta_client import Letta
+from letta_client import Letta, AsyncLetta
+import asyncio
 import os
+import time
 import dotenv
 import json
+import re
 import google.generativeai as genai
 from .pill_identifier import prod_img
 from .general_history import *
+from .response_cache import ResponseCache, normalize_key
+from .async_runtime import limited, gather
+from .rate_limit import generate, generate_async
+from .registry import registry, gemini_model
+from .single_flight import single_flight, flights
+from . import pdf_text
 
 # Load environment variables
 dotenv.load_dotenv()
 
 # Configure LeTTA and Gemini
 client = Letta(token=os.getenv("LETTA_API_KEY"))
+# Only awaited on the shared loop from backend.async_runtime
+async_client = AsyncLetta(token=os.getenv("LETTA_API_KEY"))
 genai.configure(api_key=os.getenv("GENAI_API_KEY"))
 
+# Explanations shared across users and sessions, keyed by normalised medicine name
+explanation_cache = ResponseCache(
+    "medicine_explanations",
+    ttl=float(os.getenv("EXPLANATION_CACHE_TTL", 7 * 24 * 3600)),
+    max_entries=int(os.getenv("EXPLANATION_CACHE_SIZE", 2000)),
+)
+
+# Guidance for the default "I missed my X" question, keyed by medicine name.
+# That question carries no patient data and every session talks to the same
+# conversational agent, so the answer depends on the medicine alone; questions
+# with the user's own wording are never cached.
+advice_cache = ResponseCache(
+    "missed_dose_advice",
+    ttl=float(os.getenv("ADVICE_CACHE_TTL", 24 * 3600)),
+    max_entries=int(os.getenv("ADVICE_CACHE_SIZE", 2000)),
+)
+
+# After a batch reply that answers none of its names (prose, or a format the
+# parser does not know), explanations go one request per name for this long
+EXPLANATION_BATCH_RETRY_AFTER = float(os.getenv("EXPLANATION_BATCH_RETRY_AFTER", 3600))
+
 def agents():
-    """Returns a dictionary of agent instances."""
+    """Returns a dictionary of the shared agent instances."""
     return {
         "document_parser": DocumentParser.getInstance(),
         "insurance_recommender": InsuranceRecommender.getInstance(),
@@ -24,6 +55,83 @@ def agents():
         "conversational_interface": ConversationalInterface.getInstance()
     }
 
+def _by_name(self, name, *args, **kwargs):
+    """Single-flight key for methods taking a medicine name first."""
+    return normalize_key(name)
+
+def _by_drug(self, medication_name):
+    try:
+        return normalize_key(PillIdentifier._drug_name(medication_name) or "")
+    except Exception:
+        return normalize_key(medication_name)
+
+def assistant_content(response):
+    """Content of the first assistant message in an agent response, or None."""
+    for message in response.messages:
+        if message.message_type == "assistant_message":
+            return message.content
+
+_RESPONSE_FIELD = re.compile(r'"[Rr]esponse"\s*:\s*"')
+
+def _escape_end(text, start):
+    """Index up to which the JSON string body text[start:] can be decoded without splitting an escape."""
+    i = start
+    while i < len(text):
+        if text[i] == '"':
+            return i
+        if text[i] == "\\":
+            if i + 1 >= len(text):
+                return i
+            if text[i + 1] == "u":
+                # A high surrogate is decoded together with its pair
+                width = 12 if text[i + 2:i + 4].lower() in ("d8", "d9", "da", "db") else 6
+                if i + width > len(text):
+                    return i
+                i += width
+                continue
+            i += 2
+            continue
+        i += 1
+    return i
+
+def response_text_stream(chunks):
+    """
+    Yield the text of streamed reply chunks. Agents that answer with a JSON
+    {"response": ...} object have only that field's value yielded, decoded
+    as it arrives; other replies pass through unchanged.
+    """
+    buffer, pos, state = "", 0, "start"
+    for chunk in chunks:
+        buffer += chunk
+        if state == "start":
+            if not buffer.strip():
+                continue
+            if not buffer.lstrip().startswith("{"):
+                state = "raw"
+                yield buffer
+                continue
+            state = "key"
+        if state == "raw":
+            yield chunk
+        elif state == "key":
+            match = _RESPONSE_FIELD.search(buffer)
+            if match:
+                pos, state = match.end(), "value"
+        if state == "value":
+            end = _escape_end(buffer, pos)
+            if end > pos:
+                yield json.loads(f'"{buffer[pos:end]}"')
+                pos = end
+            if pos < len(buffer) and buffer[pos] == '"':
+                state = "done"
+    if state == "key" or (state == "start" and buffer):
+        # No response field after all: fall back to the whole reply.
+        try:
+            content = json.loads(buffer)
+        except json.JSONDecodeError:
+            content = buffer
+        yield str(ConversationalInterface._reply_text(content))
+
 class Agent():
     """Base class for all agents."""
     
@@ -38,13 +146,42 @@ class Agent():
             raise ValueError(f"{self.name} ID environment variable is not set.")
         self.agent = self.client.agents.retrieve(agent_id=self.id)
     
+    def _messages(self, content):
+        return [{"role": "user", "content": content}]
+
+    def send(self, content):
+        """Send one user message to this agent and return the assistant reply."""
+        with registry.slot(f"agent:{type(self).__name__}"):
+            response = self.client.agents.messages.create(agent_id=self.id, messages=self._messages(content))
+        return assistant_content(response)
+
+    async def send_async(self, content):
+        """Async counterpart of send(), bounded by the shared concurrency limit."""
+        async with registry.async_slot(f"agent:{type(self).__name__}"):
+            response = await limited(
+                async_client.agents.messages.create(agent_id=self.id, messages=self._messages(content))
+            )
+        return assistant_content(response)
+
+    def stream(self, content):
+        """
+        Like send(), but yield the assistant reply in chunks as the agent
+        produces them. The agent's concurrency slot is held until the
+        generator is exhausted or closed.
+        """
+        with registry.slot(f"agent:{type(self).__name__}"):
+            chunks = self.client.agents.messages.create_stream(
+                agent_id=self.id, messages=self._messages(content), stream_tokens=True
+            )
+            for chunk in chunks:
+                if getattr(chunk, "message_type", None) == "assistant_message" and chunk.content:
+                    yield chunk.content if isinstance(chunk.content, str) else str(chunk.content)
+
     def extract_response_info(self, response_message):
         json_message = json.loads(response_message)
         return json_message['medical_history'], json_message["doctors note"]
 
 class DocumentParser(Agent):
-    _instance = None
-
     def __init__(self):
         super().__init__(
             name="document parser",
@@ -54,35 +191,28 @@ class DocumentParser(Agent):
 
     @staticmethod
     def getInstance():
-        if DocumentParser._instance is None:
-            DocumentParser._instance = DocumentParser()
-        return DocumentParser._instance
+        return registry.get("agent:DocumentParser", DocumentParser)
     
+    def iter_pdf_pages(self, pdf):
+        """Page texts in order, extracted in parallel for long documents."""
+        return pdf_text.iter_pages(pdf)
+
     def extract_text_with_pypdf(self, pdf):
-        reader = PdfReader(pdf)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text()
-        return text
+        return "".join(self.iter_pdf_pages(pdf))
     
+    @staticmethod
+    def _parser_prompt(pdf_text, user_info):
+        return f"Analyze the following PDF content: {pdf_text} for the user, who's info is as follows: {user_info}"
+
     def doc_parser(self, pdf, user_info=""):
         pdf_text = self.extract_text_with_pypdf(pdf)
-        response = client.agents.messages.create(
-            agent_id=os.getenv("DOCUMENT_PARSER_ID"),
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"Analyze the following PDF content: {pdf_text} for the user, who's info is as follows: {user_info}"
-                }
-            ]
-        )
-        for message in response.messages:
-            if message.message_type == "assistant_message":
-                return message.content
+        return self.send(self._parser_prompt(pdf_text, user_info))
 
-class InsuranceRecommender(Agent):
-    _instance = None
+    async def doc_parser_async(self, pdf, user_info=""):
+        pdf_text = await asyncio.to_thread(self.extract_text_with_pypdf, pdf)
+        return await self.send_async(self._parser_prompt(pdf_text, user_info))
 
+class InsuranceRecommender(Agent):
     def __init__(self):
         super().__init__(
             name="insurance recommender",
@@ -92,12 +222,11 @@ class InsuranceRecommender(Agent):
 
     @staticmethod
     def getInstance():
-        if InsuranceRecommender._instance is None:
-            InsuranceRecommender._instance = InsuranceRecommender()
-        return InsuranceRecommender._instance
+        return registry.get("agent:InsuranceRecommender", InsuranceRecommender)
 
 class MedicineExplainer(Agent):
-    _instance = None
+    # No batch requests before this time (see EXPLANATION_BATCH_RETRY_AFTER)
+    _batch_retry_at = 0.0
 
     def __init__(self):
         super().__init__(
@@ -108,27 +237,179 @@ class MedicineExplainer(Agent):
 
     @staticmethod
     def getInstance():
-        if MedicineExplainer._instance is None:
-            MedicineExplainer._instance = MedicineExplainer()
-        return MedicineExplainer._instance
+        return registry.get("agent:MedicineExplainer", MedicineExplainer)
     
+    @single_flight("medicine_explainer", _by_name)
     def medicine_explainer(self, medicine_name):
-        response = client.agents.messages.create(
-            agent_id=os.getenv("MEDICINE_EXPLAINER_ID"),
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"Please explain {medicine_name} using research"
-                }
-            ]
+        return self._explain(medicine_name)
+
+    @single_flight("medicine_explainer", _by_name)
+    async def medicine_explainer_async(self, medicine_name):
+        return await self._explain_async(medicine_name)
+
+    def _explain(self, medicine_name):
+        cached = explanation_cache.get(medicine_name)
+        if cached is not None:
+            return cached
+        explanation = self.send(f"Please explain {medicine_name} using research")
+        if explanation is not None:
+            explanation_cache.set(medicine_name, explanation)
+        return explanation
+
+    async def _explain_async(self, medicine_name):
+        # The caches are SQLite-backed; keep their I/O off the event loop.
+        cached = await asyncio.to_thread(explanation_cache.get, medicine_name)
+        if cached is not None:
+            return cached
+        explanation = await self.send_async(f"Please explain {medicine_name} using research")
+        if explanation is not None:
+            await asyncio.to_thread(explanation_cache.set, medicine_name, explanation)
+        return explanation
+
+    @staticmethod
+    def _batch_prompt(medicine_names):
+        return (
+            f"Please explain each of these medicines using research: {json.dumps(medicine_names)}. "
+            "Respond ONLY with a JSON object that maps each medicine name, exactly as given, "
+            "to its explanation."
         )
-        for message in response.messages:
-            if message.message_type == "assistant_message":
-                return message.content
 
-class PillIdentifier(Agent):
-    _instance = None
+    @staticmethod
+    def _parse_batch(content, medicine_names):
+        """{name: explanation} for the names the agent answered, matched case-insensitively."""
+        if isinstance(content, str):
+            text = content.strip()
+            if text.startswith("```"):
+                text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+            try:
+                content = json.loads(text)
+            except json.JSONDecodeError:
+                return {}
+        if not isinstance(content, dict):
+            return {}
+        # Agents that wrap every reply as {"response": ...}
+        if set(content) == {"response"}:
+            return MedicineExplainer._parse_batch(content["response"], medicine_names)
+        answers = {normalize_key(name): value for name, value in content.items()}
+        return {
+            name: answers[normalize_key(name)]
+            for name in medicine_names
+            if answers.get(normalize_key(name))
+        }
+
+    def _batch_split(self, medicine_names):
+        """(already cached {name: explanation}, distinct names still to ask about)."""
+        found, missing, seen = {}, [], set()
+        for name in medicine_names:
+            key = normalize_key(name)
+            if key in seen:
+                continue
+            seen.add(key)
+            cached = explanation_cache.get(name)
+            if cached is not None:
+                found[name] = cached
+            else:
+                missing.append(name)
+        return found, missing
+
+    @staticmethod
+    def _batch_lead(missing):
+        """
+        Register a medicine_explainer flight for each name in `missing`:
+        ({name: (key, call)} this batch answers, {name: call} already being
+        asked about by someone else).
+        """
+        led, following = {}, {}
+        for name in missing:
+            key = ("medicine_explainer", normalize_key(name))
+            call, leader = flights.join(key)
+            if leader:
+                led[name] = (key, call)
+            else:
+                following[name] = call
+        return led, following
 
+    def _batch_answers(self, content, names):
+        answered = self._parse_batch(content, names)
+        if not answered:
+            self._batch_retry_at = time.time() + EXPLANATION_BATCH_RETRY_AFTER
+        return answered
+
+    @staticmethod
+    def _batch_merge(medicine_names, found, answered):
+        found.update((name, value) for name, value in answered.items() if value is not None)
+        by_key = {normalize_key(name): value for name, value in found.items()}
+        return {name: by_key.get(normalize_key(name)) for name in medicine_names}
+
+    def medicine_explainer_batch(self, medicine_names):
+        """
+        Explain several medicines with one agent request. Returns
+        {name: explanation} for every name given and fills the shared
+        explanation cache.
+
+        Each uncached name joins the same single-flight as
+        medicine_explainer(), so concurrent batches and single calls never
+        ask about one medicine twice. Names the reply leaves out are asked
+        about individually and concurrently; after a reply that answers
+        nothing, batching is skipped for EXPLANATION_BATCH_RETRY_AFTER.
+        """
+        found, missing = self._batch_split(medicine_names)
+        led, following = self._batch_lead(missing)
+        answered = {}
+        try:
+            names = list(led)
+            if len(names) > 1 and time.time() >= self._batch_retry_at:
+                answered = self._batch_answers(self.send(self._batch_prompt(names)), names)
+                for name, explanation in answered.items():
+                    explanation_cache.set(name, explanation)
+            left = [name for name in names if name not in answered]
+            if left:
+                answered.update(zip(left, gather(*(self._explain_async(name) for name in left))))
+        except BaseException as e:
+            for key, call in led.values():
+                flights.resolve(key, call, error=e)
+            raise
+        for name, (key, call) in led.items():
+            flights.resolve(key, call, answered.get(name))
+        for name, call in following.items():
+            try:
+                answered[name] = flights.wait(call)
+            except Exception:
+                answered[name] = None
+        return self._batch_merge(medicine_names, found, answered)
+
+    async def medicine_explainer_batch_async(self, medicine_names):
+        found, missing = await asyncio.to_thread(self._batch_split, medicine_names)
+        led, following = self._batch_lead(missing)
+        answered = {}
+        try:
+            names = list(led)
+            if len(names) > 1 and time.time() >= self._batch_retry_at:
+                answered = self._batch_answers(await self.send_async(self._batch_prompt(names)), names)
+                for name, explanation in answered.items():
+                    await asyncio.to_thread(explanation_cache.set, name, explanation)
+            left = [name for name in names if name not in answered]
+            if left:
+                answered.update(zip(left, await asyncio.gather(*(self._explain_async(name) for name in left))))
+        except BaseException as e:
+            for key, call in led.values():
+                flights.resolve(key, call, error=e)
+            raise
+        for name, (key, call) in led.items():
+            flights.resolve(key, call, answered.get(name))
+        for name, call in following.items():
+            try:
+                answered[name] = await flights.wait_async(call)
+            except Exception:
+                answered[name] = None
+        return self._batch_merge(medicine_names, found, answered)
+
+    @staticmethod
+    def cache_stats():
+        """Hit/miss counters for the shared explanation cache."""
+        return explanation_cache.stats()
+
+class PillIdentifier(Agent):
     def __init__(self):
         super().__init__(
             name="pill identifier",
@@ -138,14 +419,12 @@ class PillIdentifier(Agent):
 
     @staticmethod
     def getInstance():
-        if PillIdentifier._instance is None:
-            PillIdentifier._instance = PillIdentifier()
-        return PillIdentifier._instance
+        return registry.get("agent:PillIdentifier", PillIdentifier)
     
-    def pill_identifier(self, image):
+    def pill_identifier(self, image, refresh=False):
         try:
             print(f"DEBUG: Calling prod_img with image type: {type(image)}")
-            result = prod_img(image)
+            result = prod_img(image, refresh=refresh)
             print(f"DEBUG: prod_img returned: {result} (type: {type(result)})")
             
             if result is None:
@@ -172,49 +451,44 @@ class PillIdentifier(Agent):
             print(f"DEBUG: {error_msg}")
             return error_msg
     
+    @single_flight("pill_explainer", _by_name)
     def pill_explainer(self, medication_name):
         try:
             print(f"DEBUG: Explaining medication: {medication_name}")
-            response = client.agents.messages.create(
-                agent_id=os.getenv("PILL_IDENTIFIER_ID"),
-                messages=[
-                    {
-                        "role": "user",
-                        "content": f"Please provide information on the provided medicine: {medication_name}"
-                    }
-                ]
-            )
-            for message in response.messages:
-                if message.message_type == "assistant_message":
-                    return message.content
+            return self.send(f"Please provide information on the provided medicine: {medication_name}")
         except Exception as e:
             error_msg = f"Error explaining medication: {str(e)}"
             print(f"DEBUG: {error_msg}")
             return error_msg
 
-    def find_cheapest_price(self, medication_name):
+    @single_flight("pill_explainer", _by_name)
+    async def pill_explainer_async(self, medication_name):
         try:
-            print(f"DEBUG: Finding price for: {medication_name}")
-            
-            # Handle different input types
-            drug_name = None
-            if isinstance(medication_name, str):
-                try:
-                    # Try to parse as JSON first
-                    drug_info = json.loads(medication_name)
-                    drug_name = drug_info.get("generic_name") or drug_info.get("brand_name")
-                except json.JSONDecodeError:
-                    # If not JSON, use the string directly as drug name
-                    drug_name = medication_name.strip()
-            elif isinstance(medication_name, dict):
-                drug_name = medication_name.get("generic_name") or medication_name.get("brand_name")
-            else:
-                drug_name = str(medication_name)
-                
-            if not drug_name:
-                return {"error": "Drug name not found in extracted info."}
+            print(f"DEBUG: Explaining medication: {medication_name}")
+            return await self.send_async(f"Please provide information on the provided medicine: {medication_name}")
+        except Exception as e:
+            error_msg = f"Error explaining medication: {str(e)}"
+            print(f"DEBUG: {error_msg}")
+            return error_msg
+
+    @staticmethod
+    def _drug_name(medication_name):
+        # Handle different input types
+        if isinstance(medication_name, str):
+            try:
+                # Try to parse as JSON first
+                drug_info = json.loads(medication_name)
+                return drug_info.get("generic_name") or drug_info.get("brand_name")
+            except json.JSONDecodeError:
+                # If not JSON, use the string directly as drug name
+                return medication_name.strip()
+        elif isinstance(medication_name, dict):
+            return medication_name.get("generic_name") or medication_name.get("brand_name")
+        return str(medication_name)
 
-            prompt = f"""
+    @staticmethod
+    def _price_prompt(drug_name):
+        return f"""
             Find and return the link for the cheapest price of the drug named '{drug_name}'.
             Make sure it is from a reputable source.
             Return the link in a JSON with the following fields. Include no other text in your response:
@@ -225,27 +499,52 @@ class PillIdentifier(Agent):
             }}
             """
 
-            model = genai.GenerativeModel(model_name="gemini-2.5-flash")
-            response = model.generate_content(prompt)
-            
-            # Clean the response text to extract JSON
-            response_text = response.text.strip()
-            # Remove markdown code blocks if present
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-            
-            return json.loads(response_text.strip())
+    @staticmethod
+    def _parse_price(response):
+        # Clean the response text to extract JSON
+        response_text = response.text.strip()
+        # Remove markdown code blocks if present
+        if response_text.startswith("```json"):
+            response_text = response_text[7:]
+        if response_text.endswith("```"):
+            response_text = response_text[:-3]
+        return json.loads(response_text.strip())
+
+    @single_flight("find_cheapest_price", _by_drug)
+    def find_cheapest_price(self, medication_name):
+        try:
+            print(f"DEBUG: Finding price for: {medication_name}")
+            drug_name = self._drug_name(medication_name)
+            if not drug_name:
+                return {"error": "Drug name not found in extracted info."}
+
+            model = gemini_model("gemini-2.5-flash")
+            response = generate(model, self._price_prompt(drug_name))
+            return self._parse_price(response)
 
         except Exception as e:
             error_msg = f"Gemini price search failed: {str(e)}"
             print(f"DEBUG: {error_msg}")
             return {"error": error_msg}
 
-class ConversationalInterface(Agent):
-    _instance = None
+    @single_flight("find_cheapest_price", _by_drug)
+    async def find_cheapest_price_async(self, medication_name):
+        try:
+            print(f"DEBUG: Finding price for: {medication_name}")
+            drug_name = self._drug_name(medication_name)
+            if not drug_name:
+                return {"error": "Drug name not found in extracted info."}
+
+            model = gemini_model("gemini-2.5-flash")
+            response = await generate_async(model, self._price_prompt(drug_name))
+            return self._parse_price(response)
 
+        except Exception as e:
+            error_msg = f"Gemini price search failed: {str(e)}"
+            print(f"DEBUG: {error_msg}")
+            return {"error": error_msg}
+
+class ConversationalInterface(Agent):
     def __init__(self):
         super().__init__(
             name="conversational interface",
@@ -255,29 +554,83 @@ class ConversationalInterface(Agent):
 
     @staticmethod
     def getInstance():
-        if ConversationalInterface._instance is None:
-            ConversationalInterface._instance = ConversationalInterface()
-        return ConversationalInterface._instance
+        return registry.get("agent:ConversationalInterface", ConversationalInterface)
     
+    @staticmethod
+    def _reply_text(content):
+        # Handle different response formats
+        if isinstance(content, dict):
+            return content.get("Response", content.get("response", str(content)))
+        return content
+
     def conversation(self, query):
         try:
             print(f"DEBUG: Conversational query: {query}")
-            response = client.agents.messages.create(
-                agent_id=os.getenv("CONVERSATIONAL_INTERFACE_ID"),
-                messages=[
-                    {
-                        "role": "user",
-                        "content": f"{query}"
-                    }
-                ]
-            )
-            for message in response.messages:
-                if message.message_type == "assistant_message":
-                    # Handle different response formats
-                    content = message.content
-                    if isinstance(content, dict):
-                        return content.get("Response", content.get("response", str(content)))
-                    return content
+            return self._reply_text(self.send(f"{query}"))
+        except Exception as e:
+            error_msg = f"Conversation error: {str(e)}"
+            print(f"DEBUG: {error_msg}")
+            return error_msg
+
+    @staticmethod
+    def missed_dose_query(medicine_name, question=""):
+        if question.strip():
+            return f"I missed my {medicine_name}. {question}"
+        return f"I missed my {medicine_name}. What should I do?"
+
+    @single_flight("missed_dose_advice", _by_name)
+    def missed_dose_advice(self, medicine_name):
+        """Cached answer to the default missed-dose question; errors are not cached."""
+        cached = advice_cache.get(medicine_name)
+        if cached is not None:
+            return cached
+        advice = self._reply_text(self.send(self.missed_dose_query(medicine_name)))
+        if advice is not None:
+            advice_cache.set(medicine_name, advice)
+        return advice
+
+    @single_flight("missed_dose_advice", _by_name)
+    async def missed_dose_advice_async(self, medicine_name):
+        cached = await asyncio.to_thread(advice_cache.get, medicine_name)
+        if cached is not None:
+            return cached
+        advice = self._reply_text(await self.send_async(self.missed_dose_query(medicine_name)))
+        if advice is not None:
+            await asyncio.to_thread(advice_cache.set, medicine_name, advice)
+        return advice
+
+    def missed_dose_advice_stream(self, medicine_name):
+        """
+        missed_dose_advice() as a generator of reply chunks. A reply that
+        streams to the end is cached like the blocking call's.
+        """
+        parts = []
+        try:
+            for part in response_text_stream(self.stream(self.missed_dose_query(medicine_name))):
+                parts.append(part)
+                yield part
+        except Exception as e:
+            error_msg = f"Conversation error: {str(e)}"
+            print(f"DEBUG: {error_msg}")
+            yield error_msg
+            return
+        if parts:
+            advice_cache.set(medicine_name, "".join(parts))
+
+    def conversation_stream(self, query):
+        """conversation() as a generator of reply chunks, for progressive rendering."""
+        try:
+            print(f"DEBUG: Conversational query (streaming): {query}")
+            yield from response_text_stream(self.stream(f"{query}"))
+        except Exception as e:
+            error_msg = f"Conversation error: {str(e)}"
+            print(f"DEBUG: {error_msg}")
+            yield error_msg
+
+    async def conversation_async(self, query):
+        try:
+            print(f"DEBUG: Conversational query: {query}")
+            return self._reply_text(await self.send_async(f"{query}"))
         except Exception as e:
             error_msg = f"Conversation error: {str(e)}"
             print(f"DEBUG: {error_msg}")
@@ -286,6 +639,9 @@ class ConversationalInterface(Agent):
 # Export for cleaner imports
 __all__ = [
     "agents",
+    "registry",
+    "explanation_cache",
+    "advice_cache",
     "DocumentParser",
     "InsuranceRecommender",
     "MedicineExplainer",
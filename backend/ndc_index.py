@@ -0,0 +1,276 @@
+"""
+Offline copy of the FDA NDC Directory.
+
+The directory is published as ndctext.zip (product.txt + package.txt, tab
+separated) at https://www.fda.gov/drugs/drug-approvals-and-databases/national-drug-code-directory.
+Build the index ahead of time with
+
+    python -m backend.ndc_index path/to/ndctext.zip
+
+or drop the zip (or its extracted folder) at NDC_SNAPSHOT and it is built into
+NDC_DB on a background thread on first use; lookups miss until it is ready.
+
+Lookups are by product NDC (labeler-product) or package NDC in any of the
+10-digit 4-4-2 / 5-3-2 / 5-4-1 layouts or the 11-digit 5-4-2 billing form.
+"""
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import zipfile
+from datetime import datetime
+from functools import lru_cache
+
+NDC_SNAPSHOT = os.getenv("NDC_SNAPSHOT", "data/ndctext.zip")
+NDC_DB = os.getenv("NDC_DB", "data/ndc.db")
+
+# Both tables key on the NDC as an integer (zero-padded 5-4 product or
+# 5-4-2 package digits), so a lookup is a single rowid probe.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    product_ndc INTEGER PRIMARY KEY,
+    brand_name TEXT,
+    generic_name TEXT,
+    dosage_form TEXT,
+    route TEXT,
+    manufacturer TEXT,
+    ingredients TEXT,
+    pharm_classes TEXT,
+    marketing_category TEXT,
+    dea_schedule TEXT
+);
+CREATE TABLE IF NOT EXISTS packages (
+    package_ndc INTEGER PRIMARY KEY,
+    product_ndc INTEGER NOT NULL,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Zero-padding targets per segment for the product and package forms
+_WIDTHS = (5, 4, 2)
+# Unhyphenated 10-digit codes: which labeler/product/package split to try
+_LAYOUTS = {10: ((4, 4, 2), (5, 3, 2), (5, 4, 1)), 8: ((4, 4), (5, 3))}
+
+
+def _pad(segments):
+    return "".join(seg.zfill(width) for seg, width in zip(segments, _WIDTHS))
+
+
+def ndc_candidates(code):
+    """
+    Canonical digit strings (9 digits for a product NDC, 11 for a package)
+    that `code` can stand for. Hyphenated codes are unambiguous; bare
+    10-digit ones have up to three readings.
+    """
+    code = str(code).strip()
+    if "-" in code:
+        segments = [seg for seg in re.split(r"\s*-\s*", code) if seg]
+        if len(segments) in (2, 3) and all(seg.isdigit() for seg in segments) \
+                and all(len(seg) <= width for seg, width in zip(segments, _WIDTHS)):
+            return [_pad(segments)]
+        return []
+    digits = re.sub(r"\D", "", code)
+    if len(digits) in (9, 11):
+        return [digits]
+    candidates = []
+    for layout in _LAYOUTS.get(len(digits), ()):
+        segments, start = [], 0
+        for width in layout:
+            segments.append(digits[start:start + width])
+            start += width
+        candidates.append(_pad(segments))
+    return candidates
+
+
+def format_ndc(digits):
+    """11 digits -> 5-4-2, 9 digits -> 5-4."""
+    if len(digits) == 11:
+        return f"{digits[:5]}-{digits[5:9]}-{digits[9:]}"
+    return f"{digits[:5]}-{digits[5:9]}"
+
+
+def _open_tables(source):
+    """(product.txt, package.txt) readers from ndctext.zip or its extracted folder."""
+    if os.path.isdir(source):
+        return [open(os.path.join(source, name), encoding="latin-1", newline="") for name in ("product.txt", "package.txt")]
+    archive = zipfile.ZipFile(source)
+    members = {os.path.basename(name).lower(): name for name in archive.namelist()}
+    return [
+        io.TextIOWrapper(archive.open(members[name]), encoding="latin-1", newline="")
+        for name in ("product.txt", "package.txt")
+    ]
+
+
+def _ingredients(row):
+    names = (row.get("SUBSTANCENAME") or "").split(";")
+    strengths = (row.get("ACTIVE_NUMERATOR_STRENGTH") or "").split(";")
+    units = (row.get("ACTIVE_INGRED_UNIT") or "").split(";")
+    return [
+        " ".join(part.strip() for part in (name, strengths[i] if i < len(strengths) else "",
+                                           units[i] if i < len(units) else "") if part.strip())
+        for i, name in enumerate(names) if name.strip()
+    ]
+
+
+def build_index(source=NDC_SNAPSHOT, path=NDC_DB):
+    """Build the SQLite index at `path` from an FDA ndctext snapshot, replacing any old one."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    product_file, package_file = _open_tables(source)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(SCHEMA)
+        products = 0
+        with product_file:
+            for row in csv.DictReader(product_file, delimiter="\t"):
+                candidates = ndc_candidates(row.get("PRODUCTNDC", ""))
+                if not candidates:
+                    continue
+                brand = " ".join(filter(None, (row.get("PROPRIETARYNAME"), row.get("PROPRIETARYNAMESUFFIX"))))
+                conn.execute(
+                    "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        int(candidates[0]), brand or None, row.get("NONPROPRIETARYNAME"),
+                        row.get("DOSAGEFORMNAME"), row.get("ROUTENAME"), row.get("LABELERNAME"),
+                        json.dumps(_ingredients(row)), row.get("PHARM_CLASSES"),
+                        row.get("MARKETINGCATEGORYNAME"), row.get("DEASCHEDULE") or None,
+                    ),
+                )
+                products += 1
+        packages = 0
+        with package_file:
+            for row in csv.DictReader(package_file, delimiter="\t"):
+                package = ndc_candidates(row.get("NDCPACKAGECODE", ""))
+                product = ndc_candidates(row.get("PRODUCTNDC", ""))
+                if not package or not product:
+                    continue
+                conn.execute(
+                    "INSERT OR REPLACE INTO packages VALUES (?, ?, ?)",
+                    (int(package[0]), int(product[0]), row.get("PACKAGEDESCRIPTION")),
+                )
+                packages += 1
+        conn.executemany(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+            [("source", os.path.abspath(source)), ("built", datetime.now().isoformat()),
+             ("products", str(products)), ("packages", str(packages))],
+        )
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return {"products": products, "packages": packages}
+
+
+class NDCIndex:
+    """Read-only lookups against a built NDC index."""
+
+    def __init__(self, path=NDC_DB):
+        self.path = path
+        self._local = threading.local()
+        # Repeat scans of the same product never touch SQLite.
+        self._cached = lru_cache(maxsize=4096)(self._lookup)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def _product(self, conn, product_ndc):
+        row = conn.execute("SELECT * FROM products WHERE product_ndc = ?", (product_ndc,)).fetchone()
+        if row is None:
+            return None
+        (_, brand, generic, form, route, manufacturer, ingredients, classes, category, schedule) = row
+        return {
+            "product_ndc": format_ndc(f"{product_ndc:09d}"),
+            "brand_name": brand,
+            "generic_name": generic,
+            "dosage_form": form,
+            "route": route,
+            "manufacturer": manufacturer,
+            "ingredients": json.loads(ingredients or "[]"),
+            "pharm_classes": classes,
+            "marketing_category": category,
+            "dea_schedule": schedule,
+            "source": "FDA NDC Directory",
+        }
+
+    def lookup(self, code):
+        """The FDA record for a product or package NDC, or None if unknown or malformed."""
+        record = self._cached(str(code))
+        return dict(record) if record is not None else None
+
+    def _lookup(self, code):
+        conn = self._connect()
+        for digits in ndc_candidates(code):
+            if len(digits) == 11:
+                row = conn.execute(
+                    "SELECT product_ndc, description FROM packages WHERE package_ndc = ?", (int(digits),)
+                ).fetchone()
+                if row is None:
+                    continue
+                record = self._product(conn, row[0])
+                if record is not None:
+                    return {**record, "package_ndc": format_ndc(digits), "package_description": row[1]}
+            else:
+                record = self._product(conn, int(digits))
+                if record is not None:
+                    return record
+        return None
+
+
+_index = None
+_index_lock = threading.Lock()
+_builder = None
+
+
+def _build_in_background():
+    try:
+        build_index(NDC_SNAPSHOT, NDC_DB)
+    except Exception as e:
+        # Not retried until restart; the CLI shows the full error.
+        print(f"❌ Building the NDC index from {NDC_SNAPSHOT} failed: {e}")
+
+
+def ndc_index():
+    """
+    The process-wide NDCIndex, or None while no built index exists. The
+    first call with only NDC_SNAPSHOT present starts building it on a
+    background thread instead of blocking the caller.
+    """
+    global _index, _builder
+    with _index_lock:
+        if _index is None and os.path.exists(NDC_DB):
+            _index = NDCIndex(NDC_DB)
+        if _index is None and _builder is None and os.path.exists(NDC_SNAPSHOT):
+            _builder = threading.Thread(target=_build_in_background, name="ndc-index-build", daemon=True)
+            _builder.start()
+        return _index
+
+
+def building():
+    """True while the background build started by ndc_index() is running."""
+    return _builder is not None and _builder.is_alive()
+
+
+def lookup_ndc(code):
+    """Resolve an NDC through the local index; None when unknown or no index is installed."""
+    index = ndc_index()
+    return index.lookup(code) if index is not None else None
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else NDC_SNAPSHOT
+    print(build_index(source, sys.argv[2] if len(sys.argv) > 2 else NDC_DB))
@@ -0,0 +1,87 @@
+import io
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pypdf import PdfReader
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
+# Most pages extracted but not yet consumed at any time
+PDF_PAGE_WINDOW = int(os.getenv("PDF_PAGE_WINDOW", 32))
+# Pages per task; each worker parses the document once, then takes chunks
+PDF_CHUNK_PAGES = 4
+# Below this, starting worker processes costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 16))
+
+_reader = None
+
+
+def _init_worker(data):
+    global _reader
+    _reader = PdfReader(io.BytesIO(data))
+
+
+def _extract(start, stop):
+    return [_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _read_bytes(pdf):
+    if isinstance(pdf, (bytes, bytearray)):
+        return bytes(pdf)
+    if hasattr(pdf, "getvalue"):
+        return pdf.getvalue()
+    if hasattr(pdf, "read"):
+        pdf.seek(0)
+        return pdf.read()
+    with open(pdf, "rb") as f:
+        return f.read()
+
+
+def _context():
+    # Forking a process that runs the agent loop thread and holds SQLite
+    # connections is unsafe; forkserver/spawn start clean workers.
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def iter_pages(pdf, workers=PDF_WORKERS, window=PDF_PAGE_WINDOW):
+    """
+    Yield the text of each page of `pdf` (path, bytes or file-like) in order.
+
+    Long documents are split into page chunks extracted by a process pool;
+    at most `window` pages are queued or buffered at once, so memory stays
+    bounded and callers can start on the first pages while later ones are
+    still being extracted.
+    """
+    data = _read_bytes(pdf)
+    reader = PdfReader(io.BytesIO(data))
+    total = len(reader.pages)
+    if workers <= 1 or total < PDF_PARALLEL_MIN_PAGES:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    starts = iter(range(0, total, PDF_CHUNK_PAGES))
+    in_flight = max(1, window // PDF_CHUNK_PAGES)
+    workers = min(workers, in_flight, -(-total // PDF_CHUNK_PAGES))
+    with ProcessPoolExecutor(workers, mp_context=_context(), initializer=_init_worker, initargs=(data,)) as pool:
+        def submit(start):
+            return pool.submit(_extract, start, min(start + PDF_CHUNK_PAGES, total))
+
+        pending = deque(submit(start) for _, start in zip(range(in_flight), starts))
+        try:
+            while pending:
+                texts = pending.popleft().result()
+                start = next(starts, None)
+                if start is not None:
+                    pending.append(submit(start))
+                yield from texts
+        finally:
+            # Consumer stopped early: drop the queued chunks.
+            for future in pending:
+                future.cancel()
+
+
+def extract_text(pdf, **kwargs):
+    return "".join(iter_pages(pdf, **kwargs))
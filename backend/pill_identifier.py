@@ -1,9 +1,17 @@
 import google.generativeai as genai
 import os
+import io
 import json
+import hashlib
 import time
 import PIL.Image as Image
+from PIL import ImageChops, ImageOps
 import dotenv
+from .rate_limit import generate, is_rate_limited, GEMINI_MAX_RETRIES
+from .registry import registry, gemini_model
+from .label_index import dhash, label_index
+from .ndc_index import lookup_ndc, ndc_candidates
+from . import barcode
 
 dotenv.load_dotenv()
 # Use your provided Google Gemini API key directly
@@ -58,36 +66,160 @@ default_config = {
     "response_mime_type": "text/plain"
 }
 
+# Upload budget for label photos: longest edge in pixels, starting JPEG
+# quality, and the size the encoder lowers quality (down to 50) to fit under.
+LABEL_MAX_EDGE = int(os.getenv("LABEL_MAX_EDGE", 1600))
+LABEL_JPEG_QUALITY = int(os.getenv("LABEL_JPEG_QUALITY", 85))
+LABEL_MAX_BYTES = int(os.getenv("LABEL_MAX_BYTES", 400_000))
+
+# Extractor feedback that marks a reading as unreliable; such results are
+# returned but never indexed for reuse.
+_LOW_QUALITY_HINTS = ("blur", "illegible", "unreadable", "not readable", "cannot read", "can't read",
+                      "poor quality", "low quality", "obscured", "cut off")
+
+def _read_bytes(uploaded_file):
+    if hasattr(uploaded_file, "getvalue"):
+        return uploaded_file.getvalue()
+    if hasattr(uploaded_file, "read"):
+        uploaded_file.seek(0)
+        return uploaded_file.read()
+    with open(uploaded_file, "rb") as f:
+        return f.read()
+
+def _label_box(image, tolerance=24, margin=0.02):
+    """Bounding box of whatever differs from the photo's border colour, padded by `margin`."""
+    background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+    diff = ImageChops.difference(image, background).convert("L").point(lambda v: 255 if v > tolerance else 0)
+    box = diff.getbbox()
+    if box is None:
+        return None
+    pad_x, pad_y = int(image.width * margin), int(image.height * margin)
+    return (
+        max(0, box[0] - pad_x), max(0, box[1] - pad_y),
+        min(image.width, box[2] + pad_x), min(image.height, box[3] + pad_y),
+    )
+
+def preprocess_label_image(uploaded_file, max_edge=LABEL_MAX_EDGE, quality=LABEL_JPEG_QUALITY,
+                           max_bytes=LABEL_MAX_BYTES, crop=None):
+    """
+    Prepare an uploaded label photo for the vision model: apply the EXIF
+    orientation, optionally crop (`crop` is a (left, top, right, bottom) box
+    or "auto" to trim a plain background), shrink to `max_edge` and encode as
+    JPEG within `max_bytes`.
+
+    Returns (image part for generate_content, report) where the report has
+    the original/processed byte counts and sizes, bytes_saved, the dHash of
+    the processed image, a SHA-256 of the uploaded bytes and the
+    preprocessing time in ms.
+    """
+    started = time.perf_counter()
+    data = _read_bytes(uploaded_file)
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    original_size = image.size
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if crop == "auto":
+        crop = _label_box(image)
+    if crop:
+        image = image.crop(crop)
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    while True:
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        if buffer.tell() <= max_bytes or quality <= 50:
+            break
+        quality = max(50, quality - 10)
+    encoded = buffer.getvalue()
+
+    report = {
+        "original_bytes": len(data),
+        "processed_bytes": len(encoded),
+        "bytes_saved": len(data) - len(encoded),
+        "original_size": original_size,
+        "processed_size": image.size,
+        "quality": quality,
+        "dhash": dhash(image),
+        "sha256": hashlib.sha256(data).digest(),
+        "preprocess_ms": (time.perf_counter() - started) * 1000,
+    }
+    return {"mime_type": "image/jpeg", "data": encoded}, report
+
+def _same_product(ndc_code, ndcs):
+    """True when `ndc_code` and one of `ndcs` name the same product (labeler + product code)."""
+    products = {digits[:9] for digits in ndc_candidates(ndc_code or "")}
+    return any(products & {digits[:9] for digits in ndc_candidates(ndc)} for ndc in ndcs)
+
+def _indexable(result):
+    """Whether an extraction is trustworthy enough to serve for later scans."""
+    if not (result.get("generic_name") or result.get("brand_name")) or not result.get("ndc_code"):
+        return False
+    feedback = str(result.get("feedback") or "").lower()
+    return not any(hint in feedback for hint in _LOW_QUALITY_HINTS)
+
 class DrugLabelExtractor:
     def __init__(self, model_name="gemini-2.5-flash"):
         self.response = None
+        self.last_report = None
         self.model_name = model_name
-        self.model = genai.GenerativeModel(
-            model_name=model_name,
+        self.model = gemini_model(
+            model_name,
+            key=f"drug_label_extractor:{model_name}",
             safety_settings=default_safety_settings,
             system_instruction=default_system_instructions,
             generation_config=default_config
         )
 
-    def process_drug_label_image_streamlit(self, uploaded_file, retries=3) -> dict:
+    def process_drug_label_image_streamlit(self, uploaded_file, retries=GEMINI_MAX_RETRIES,
+                                           preprocess=True, crop=None, refresh=False, barcode_ndcs=()) -> dict:
+        """
+        Extract the label fields from a photo. An earlier extraction of the
+        same or a near-identical photo is reused; when `barcode_ndcs` were
+        decoded from this photo the reused result's NDC has to match one of
+        them. `refresh` always asks the model.
+        """
         try:
-            image = Image.open(uploaded_file)
+            if preprocess:
+                image, report = preprocess_label_image(uploaded_file, crop=crop)
+            else:
+                image, report = Image.open(uploaded_file), {}
         except Exception as e:
             print(f"❌ Error loading image: {e}")
             return {"error": f"Invalid image: {e}"}
 
-        for attempt in range(retries):
-            try:
-                response = self.model.generate_content(contents=[image])
-                self.response = json.loads(response.text[response.text.index("{"):response.text.rindex("}") + 1])
-                return self.response
-            except Exception as e:
-                if "429" in str(e):
-                    print(f"⏳ Rate limit hit (attempt {attempt + 1}), retrying...")
-                    time.sleep(60)
-                else:
-                    print(f"❌ Generation failed: {e}")
-                    break
+        # Re-scans: reuse an earlier extraction instead of calling the model
+        # again. Similar-looking photos can be different strengths, so a
+        # decoded barcode must agree; "read the label again" bypasses this.
+        digest = report.get("dhash")
+        if digest is not None and not refresh:
+            confirm = (lambda result: _same_product(result.get("ndc_code"), barcode_ndcs)) if barcode_ndcs else None
+            matched = label_index().lookup(digest, report.get("sha256"), confirm)
+            if matched is not None:
+                print("DEBUG: Label photo matches an indexed scan, skipping the model call")
+                self.last_report = report
+                self.response = matched
+                return matched
+
+        try:
+            started = time.perf_counter()
+            # Over-quota requests queue in the shared Gemini rate limiter
+            response = generate(self.model, contents=[image], retries=retries)
+            report["model_ms"] = (time.perf_counter() - started) * 1000
+            self.last_report = report
+            if preprocess:
+                print(
+                    f"DEBUG: Label image {report['original_size']} -> {report['processed_size']}, "
+                    f"{report['original_bytes']} -> {report['processed_bytes']} bytes "
+                    f"(saved {report['bytes_saved']}), preprocess {report['preprocess_ms']:.0f} ms, "
+                    f"model {report['model_ms']:.0f} ms"
+                )
+            self.response = json.loads(response.text[response.text.index("{"):response.text.rindex("}") + 1])
+            if digest is not None and _indexable(self.response):
+                label_index().add(digest, self.response, report.get("sha256"))
+            return self.response
+        except Exception as e:
+            if not is_rate_limited(e):
+                print(f"❌ Generation failed: {e}")
 
         return {"error": "Gemini price search failed: rate limit exceeded or invalid input."}
 
@@ -96,7 +228,49 @@ class DrugLabelExtractor:
             raise Exception("No response available. Please process an image first.")
         return self.response
 
-def prod_img(img_file):
-    extractor = DrugLabelExtractor()
-    extractor.process_drug_label_image_streamlit(img_file)
-    return extractor.return_response()
+def barcode_symbols(img_file):
+    """[(symbology, data)] for the barcodes on a label photo; empty without pyzbar."""
+    if not barcode.available():
+        return []
+    try:
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(_read_bytes(img_file))))
+    except Exception as e:
+        print(f"❌ Error loading image: {e}")
+        return []
+    return barcode.decode(image)
+
+def barcode_product(img_file):
+    """Product resolved from the label's barcode through the local NDC index, or None."""
+    return barcode.product_from_symbols(barcode_symbols(img_file))
+
+def prod_img(img_file, refresh=False):
+    # Barcodes that resolve locally need no model call at all.
+    symbols = barcode_symbols(img_file)
+    product = barcode.product_from_symbols(symbols)
+    if product is not None:
+        print(f"DEBUG: Resolved {product['ndc_code']} from barcode {product['barcode']}")
+        return product
+    # One extractor is shared by every session, so use the returned result
+    # rather than its last stored response.
+    extractor = registry.get("drug_label_extractor", DrugLabelExtractor)
+    ndcs = [ndc for ndc in (barcode.ndc_from_barcode(data) for _, data in symbols) if ndc]
+    response = extractor.process_drug_label_image_streamlit(img_file, refresh=refresh, barcode_ndcs=ndcs)
+    if "error" in response:
+        raise Exception(response["error"])
+    return with_ndc_record(response)
+
+def with_ndc_record(response):
+    """
+    Overlay the FDA NDC Directory entry for the extracted ndc_code, when the
+    local index knows it, on the model's names, manufacturer and ingredients.
+    """
+    product = lookup_ndc(response.get("ndc_code") or "")
+    if product is None:
+        return response
+    response = dict(response)
+    for field in ("brand_name", "generic_name", "manufacturer", "ingredients"):
+        if product.get(field):
+            response[field] = product[field]
+    response["ndc_code"] = product.get("package_ndc") or product["product_ndc"]
+    response["fda_ndc"] = product
+    return response
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import threading
+from datetime import datetime, time
+
+from . import async_runtime
+from .letta_calls import (
+    MedicineExplainer,
+    ConversationalInterface,
+    explanation_cache,
+    advice_cache,
+)
+from .registry import registry
+from .response_cache import normalize_key
+
+# Background requests allowed at once, across every session in the process
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", 2))
+# How long to keep yielding to foreground requests before going ahead anyway
+PREFETCH_MAX_DEFER = float(os.getenv("PREFETCH_MAX_DEFER", 30))
+
+_semaphore = None
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _claim(kind, name):
+    """True if nobody in this process is already prefetching (kind, name)."""
+    key = (kind, normalize_key(name))
+    with _pending_lock:
+        if key in _pending:
+            return False
+        _pending.add(key)
+        return True
+
+
+def _release(kind, names):
+    with _pending_lock:
+        for name in names:
+            _pending.discard((kind, normalize_key(name)))
+
+
+async def _low_priority(agent_key):
+    """Wait until no foreground request is queued for the agent (bounded)."""
+    waited = 0.0
+    while registry.stats().get(agent_key, {}).get("queued", 0) and waited < PREFETCH_MAX_DEFER:
+        await asyncio.sleep(0.5)
+        waited += 0.5
+
+
+async def _run(agent_key, coro):
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+    async with _semaphore:
+        await _low_priority(agent_key)
+        try:
+            return await coro
+        except Exception as e:
+            print(f"DEBUG: Prefetch failed for {agent_key}: {e}")
+
+
+def _overdue(medication, now):
+    scheduled = medication.get("time")
+    if isinstance(scheduled, str):
+        try:
+            scheduled = datetime.strptime(scheduled, "%H:%M").time()
+        except ValueError:
+            return False
+    return isinstance(scheduled, time) and scheduled < now.time()
+
+
+async def _prefetch(explain, advise):
+    try:
+        # Agents are built off the script thread as well: the first
+        # getInstance() is a network agents.retrieve.
+        jobs = []
+        if explain:
+            explainer = await asyncio.to_thread(MedicineExplainer.getInstance)
+            jobs.append(_run("agent:MedicineExplainer", explainer.medicine_explainer_batch_async(explain)))
+        if advise:
+            advisor = await asyncio.to_thread(ConversationalInterface.getInstance)
+            jobs.extend(
+                _run("agent:ConversationalInterface", advisor.missed_dose_advice_async(name)) for name in advise
+            )
+        await asyncio.gather(*jobs)
+    finally:
+        _release("explanation", explain)
+        _release("advice", advise)
+
+
+def prefetch_medications(medications, now=None):
+    """
+    Warm the shared caches for a medication schedule in the background:
+    explanations for every medication (one batched request) and missed-dose
+    advice for those whose time has already passed today. Returns the
+    concurrent future, or None when everything is cached or already being
+    fetched. Never blocks the caller.
+
+    `medications` is a list of {"name": ..., "time": datetime.time or "HH:MM"}.
+    """
+    now = now or datetime.now()
+    explain = [
+        med["name"] for med in medications
+        if med["name"] not in explanation_cache and _claim("explanation", med["name"])
+    ]
+    advise = [
+        med["name"] for med in medications
+        if _overdue(med, now) and med["name"] not in advice_cache and _claim("advice", med["name"])
+    ]
+    if not explain and not advise:
+        return None
+    return async_runtime.submit(_prefetch(explain, advise))
@@ -0,0 +1,76 @@
+import threading
+
+
+class ProfileCache:
+    """
+    Process-wide cache of loaded profiles, keyed by user.
+
+    An entry is reused while both its write-version counter and the store's
+    on-disk stamp (file mtimes/sizes, or a per-user SQLite version) are
+    unchanged. Writers in this process call bump(); edits made by another
+    process change the stamp instead.
+    Returned profiles are shared between sessions and must not be mutated.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._entries = {}
+        self._derived = {}
+
+    def bump(self, name):
+        """Record a write to `name` so the next read reloads it."""
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+            self._entries.pop(name, None)
+
+    def version(self, name):
+        """
+        Return a counter that changes whenever the profile's content does.
+        """
+        stamp = self.store.stamp(name)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry[1] != stamp:
+                # Changed on disk behind our back (another process).
+                self._versions[name] = self._versions.get(name, 0) + 1
+                del self._entries[name]
+            return self._versions.get(name, 0)
+
+    def peek(self, name):
+        """Return the cached profile if it is current, without loading it."""
+        version = self.version(name)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry[0] == version:
+                return entry[2]
+        return None
+
+    def get(self, name):
+        """Return the cached profile, loading it at most once per version."""
+        data = self.peek(name)
+        if data is not None:
+            return data
+        version = self.version(name)
+        stamp = self.store.stamp(name)
+        data = self.store.load(name)
+        with self._lock:
+            if self._versions.get(name, 0) == version:
+                self._entries[name] = (version, stamp, data)
+        return data
+
+    def derived(self, name, key, build):
+        """
+        Return build(profile) memoised per user, key and profile version, for
+        indexes and series computed from a profile.
+        """
+        version = self.version(name)
+        with self._lock:
+            memo = self._derived.get((name, key))
+            if memo is not None and memo[0] == version:
+                return memo[1]
+        value = build(self.get(name))
+        with self._lock:
+            self._derived[(name, key)] = (version, value)
+        return value
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+
+from .async_runtime import limited
+from .registry import registry
+
+# Requests per minute allowed per Gemini model, and how many may go back to back
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", 10))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", 3))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 3))
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 60.0
+
+_RETRY_RE = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)|retry in\s*(\d+(?:\.\d+)?)\s*s", re.I)
+
+
+class TokenBucket:
+    """
+    Token bucket handing out send times in arrival order.
+
+    acquire() reserves the next free slot under the lock and returns how long
+    the caller must wait for it, so waiters are served first come first
+    served and nobody polls. A 429 pushes the whole bucket back with
+    penalize(), so queued callers wait out the server's retry-after together
+    instead of each discovering it on their own.
+    """
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.interval = 60.0 / rate_per_minute
+        self.burst = max(1, burst)
+        self._lock = threading.Lock()
+        # Theoretical arrival time of the next request (GCRA); up to `burst`
+        # intervals of credit can build up while idle.
+        self._next = 0.0
+        self._queued = 0
+
+    def reserve(self):
+        """Claim the next slot and return the delay in seconds until it opens."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now - (self.burst - 1) * self.interval)
+            self._next = start + self.interval
+            return max(0.0, start - now)
+
+    def penalize(self, delay):
+        """Hold every caller back for at least `delay` seconds from now."""
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + delay)
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay:
+            with self._lock:
+                self._queued += 1
+            try:
+                time.sleep(delay)
+            finally:
+                with self._lock:
+                    self._queued -= 1
+
+    async def acquire_async(self):
+        delay = self.reserve()
+        if delay:
+            with self._lock:
+                self._queued += 1
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                with self._lock:
+                    self._queued -= 1
+
+    @property
+    def queued(self):
+        return self._queued
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket(model_name):
+    """The process-wide bucket for one Gemini model."""
+    with _buckets_lock:
+        if model_name not in _buckets:
+            _buckets[model_name] = TokenBucket(GEMINI_RPM, GEMINI_BURST)
+        return _buckets[model_name]
+
+
+def is_rate_limited(error):
+    return "429" in str(error) or type(error).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+
+def retry_after(error):
+    """Server-requested wait in seconds, from a Retry-After header or the error text."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    match = _RETRY_RE.search(str(error))
+    if match:
+        return float(match.group(1) or match.group(2))
+    return None
+
+
+def backoff(attempt, error):
+    """Full-jitter exponential backoff, never shorter than the server's retry-after."""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after(error) or 0.0)
+
+
+def generate(model, *args, retries=GEMINI_MAX_RETRIES, **kwargs):
+    """model.generate_content(...) through the model's bucket, retrying 429s."""
+    limiter = bucket(model.model_name)
+    for attempt in range(retries + 1):
+        with registry.waiting(model.model_name):
+            limiter.acquire()
+        try:
+            with registry.slot(model.model_name):
+                return model.generate_content(*args, **kwargs)
+        except Exception as e:
+            if not is_rate_limited(e) or attempt == retries:
+                raise
+            delay = backoff(attempt, e)
+            print(f"⏳ Rate limit hit for {model.model_name} (attempt {attempt + 1}), queueing for {delay:.1f}s")
+            limiter.penalize(delay)
+
+
+async def generate_async(model, *args, retries=GEMINI_MAX_RETRIES, **kwargs):
+    """Async generate(); the wait for a token does not hold a concurrency slot."""
+    limiter = bucket(model.model_name)
+    for attempt in range(retries + 1):
+        with registry.waiting(model.model_name):
+            await limiter.acquire_async()
+        try:
+            async with registry.async_slot(model.model_name):
+                return await limited(model.generate_content_async(*args, **kwargs))
+        except Exception as e:
+            if not is_rate_limited(e) or attempt == retries:
+                raise
+            delay = backoff(attempt, e)
+            print(f"⏳ Rate limit hit for {model.model_name} (attempt {attempt + 1}), queueing for {delay:.1f}s")
+            limiter.penalize(delay)
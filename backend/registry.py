@@ -0,0 +1,190 @@
+import asyncio
+import os
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+# Requests allowed in flight at once per model or agent (env override per key:
+# MAX_CONCURRENCY_<KEY>, e.g. MAX_CONCURRENCY_GEMINI_2_5_FLASH=2)
+DEFAULT_LIMIT = int(os.getenv("MODEL_MAX_CONCURRENCY", 4))
+
+
+def _env_limit(key):
+    name = "MAX_CONCURRENCY_" + "".join(c if c.isalnum() else "_" for c in key.split("/")[-1]).upper()
+    return int(os.getenv(name, DEFAULT_LIMIT))
+
+
+class _Slots:
+    """
+    Counting semaphore shared by blocking threads and coroutines, handing
+    freed slots to waiters in arrival order. Threads wait on an Event;
+    coroutines wait on a future of their own loop, so no thread is parked
+    per queued coroutine.
+    """
+
+    def __init__(self, limit):
+        self._lock = threading.Lock()
+        self._free = limit
+        self._waiters = deque()
+
+    def acquire(self):
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        future = waiter[1]
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = waiter in self._waiters
+                if queued:
+                    self._waiters.remove(waiter)
+            # Already granted: a cancelled future is passed on by _wake,
+            # a resolved one has to be given back here.
+            if not queued and future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._free += 1
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            loop.call_soon_threadsafe(self._wake, future)
+
+    def _wake(self, future):
+        if future.done():
+            # Its coroutine was cancelled after the slot was granted.
+            self.release()
+        else:
+            future.set_result(None)
+
+
+class _Entry:
+    def __init__(self, limit):
+        self.limit = limit
+        self.build_lock = threading.Lock()
+        self.instance = None
+        # Shared by blocking callers and coroutines so the limit holds across both
+        self.slots = _Slots(limit)
+        self.queued = 0
+        self.in_flight = 0
+
+
+class Registry:
+    """
+    Process-wide home of configured models and agents.
+
+    Each key is built once, on first use, and then shared by every session
+    and thread; a slow build (e.g. a network agents.retrieve) only blocks
+    callers of that key. Every request goes through slot()/async_slot(),
+    which caps concurrency per key and keeps the queued/in-flight counts
+    reported by stats().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(_env_limit(key))
+            return entry
+
+    def get(self, key, factory):
+        """The shared instance for `key`, built with `factory()` the first time."""
+        entry = self._entry(key)
+        if entry.instance is None:
+            with entry.build_lock:
+                if entry.instance is None:
+                    entry.instance = factory()
+        return entry.instance
+
+    def _count(self, entry, queued=0, in_flight=0):
+        with self._lock:
+            entry.queued += queued
+            entry.in_flight += in_flight
+
+    @contextmanager
+    def waiting(self, key):
+        """Count the caller as queued for `key` while it waits elsewhere (e.g. on a rate limit)."""
+        entry = self._entry(key)
+        self._count(entry, queued=1)
+        try:
+            yield
+        finally:
+            self._count(entry, queued=-1)
+
+    @contextmanager
+    def slot(self, key):
+        """Hold one of `key`'s concurrency slots for the duration of a blocking call."""
+        entry = self._entry(key)
+        with self.waiting(key):
+            entry.slots.acquire()
+        self._count(entry, in_flight=1)
+        try:
+            yield
+        finally:
+            self._count(entry, in_flight=-1)
+            entry.slots.release()
+
+    @asynccontextmanager
+    async def async_slot(self, key):
+        """
+        slot() for coroutines on the shared event loop. Takes from the same
+        slots as slot(), waiting on the loop rather than in a thread.
+        """
+        entry = self._entry(key)
+        with self.waiting(key):
+            await entry.slots.acquire_async()
+        self._count(entry, in_flight=1)
+        try:
+            yield
+        finally:
+            self._count(entry, in_flight=-1)
+            entry.slots.release()
+
+    def stats(self):
+        """{key: {"queued", "in_flight", "limit", "built"}} for every key seen so far."""
+        with self._lock:
+            return {
+                key: {
+                    "queued": entry.queued,
+                    "in_flight": entry.in_flight,
+                    "limit": entry.limit,
+                    "built": entry.instance is not None,
+                }
+                for key, entry in self._entries.items()
+            }
+
+
+registry = Registry()
+
+
+def gemini_model(model_name, key=None, **kwargs):
+    """
+    A shared genai.GenerativeModel. Pass `key` when the config differs from
+    the default; requests are still limited per underlying model either way.
+    """
+    import google.generativeai as genai
+    return registry.get(key or f"models/{model_name}", lambda: genai.GenerativeModel(model_name=model_name, **kwargs))
@@ -0,0 +1,155 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_responses_lru ON responses (namespace, accessed);
+"""
+
+
+def cache_dir():
+    path = os.getenv("ALETHEIA_CACHE_DIR", "cache")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def normalize_key(text):
+    """Case- and whitespace-insensitive cache key, e.g. for medicine names."""
+    return re.sub(r"\s+", " ", str(text)).strip().casefold()
+
+
+class ResponseCache:
+    """
+    Disk-backed cache of agent responses shared by every session and user.
+
+    Entries live in a SQLite table (one namespace per kind of response) with a
+    TTL and LRU eviction beyond `max_entries`. A small in-memory LRU sits in
+    front so repeat lookups in the same process never touch the disk; disk
+    access times are refreshed on disk hits only, so eviction order is
+    approximate.
+    """
+
+    def __init__(self, namespace, ttl=None, max_entries=1000, memory_entries=256, path=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.path = path or os.path.join(cache_dir(), "responses.db")
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _fresh(self, created, now):
+        return self.ttl is None or now - created < self.ttl
+
+    def _remember(self, key, value, created):
+        with self._lock:
+            self._memory[key] = (value, created)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key, default=None):
+        """Return the cached value for `key`, or `default` if absent or expired."""
+        key = normalize_key(key)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._fresh(entry[1], now):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._memory.pop(key, None)
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, created FROM responses WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None or not self._fresh(row[1], now):
+            with self._lock:
+                self.misses += 1
+            return default
+        conn.execute(
+            "UPDATE responses SET accessed = ? WHERE namespace = ? AND key = ?",
+            (now, self.namespace, key),
+        )
+        value = json.loads(row[0])
+        self._remember(key, value, row[1])
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, created=None):
+        """
+        Store `value` under `key` and evict the least recently used extras.
+        `created` backdates the entry (epoch seconds) when warm-loading.
+        """
+        key = normalize_key(key)
+        now = time.time()
+        created = now if created is None else created
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (namespace, key, value, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, key, json.dumps(value), created, now),
+        )
+        conn.execute(
+            "DELETE FROM responses WHERE namespace = ? AND key IN ("
+            "SELECT key FROM responses WHERE namespace = ? ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_entries),
+        )
+        if self.ttl is not None:
+            conn.execute(
+                "DELETE FROM responses WHERE namespace = ? AND created < ?",
+                (self.namespace, now - self.ttl),
+            )
+        self._remember(key, value, created)
+
+    def __contains__(self, key):
+        key = normalize_key(key)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._fresh(entry[1], time.time()):
+                return True
+        row = self._connect().execute(
+            "SELECT created FROM responses WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        return row is not None and self._fresh(row[0], time.time())
+
+    def stats(self):
+        """Hit/miss counters for this process plus the number of stored entries."""
+        size = self._connect().execute(
+            "SELECT COUNT(*) FROM responses WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": size,
+            }
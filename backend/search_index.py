@@ -0,0 +1,160 @@
+import json
+import re
+import sqlite3
+import threading
+
+SEARCHABLE_FIELDS = ("medical_history", "doctor_notes")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    field TEXT NOT NULL,
+    ts TEXT,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_docs_user ON docs (user);
+CREATE TABLE IF NOT EXISTS postings (
+    token TEXT NOT NULL,
+    user TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    PRIMARY KEY (token, user, doc_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS indexed_users (
+    name TEXT PRIMARY KEY
+);
+"""
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "he",
+    "in", "is", "it", "of", "on", "or", "she", "that", "the", "to", "was", "were", "with",
+}
+
+
+def _strings(value):
+    """Every string value inside an entry (dict keys are schema, not content)."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _strings(item)
+    elif value is not None:
+        yield str(value)
+
+
+def tokenize(value):
+    """Lower-cased word tokens of a note, query or nested history entry."""
+    tokens = set()
+    for text in _strings(value):
+        tokens.update(t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS)
+    return tokens
+
+
+class SearchIndex:
+    """
+    Inverted index over medical history entries and doctor notes.
+
+    Postings are keyed by (token, user, doc) so both per-user and cross-user
+    lookups are a single index range scan, independent of how many users are
+    on disk. It is updated incrementally as entries are written.
+    """
+
+    def __init__(self, path="users/search_index.db"):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._write_lock:
+            self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _add(self, conn, name, field, value, ts):
+        doc = conn.execute(
+            "INSERT INTO docs (user, field, ts, body) VALUES (?, ?, ?, ?)",
+            (name, field, ts, json.dumps(value)),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO postings (token, user, doc_id) VALUES (?, ?, ?)",
+            [(token, name, doc.lastrowid) for token in tokenize(value)],
+        )
+
+    def is_indexed(self, name):
+        return self._connect().execute(
+            "SELECT 1 FROM indexed_users WHERE name = ?", (name,)
+        ).fetchone() is not None
+
+    def forget(self, name):
+        """Mark `name` as not indexed, so the next search rebuilds their entries."""
+        with self._write_lock:
+            self._connect().execute("DELETE FROM indexed_users WHERE name = ?", (name,))
+
+    def indexed_users(self):
+        return {row[0] for row in self._connect().execute("SELECT name FROM indexed_users")}
+
+    def add(self, name, items):
+        """Index (field, value, ts) items newly written for `name`."""
+        items = [item for item in items if item[0] in SEARCHABLE_FIELDS]
+        if not items:
+            return
+        conn = self._connect()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for field, value, ts in items:
+                    self._add(conn, name, field, value, ts)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def reindex(self, name, profile):
+        """Replace everything indexed for `name` with the given profile."""
+        conn = self._connect()
+        timestamps = profile.get("timestamps", {})
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM postings WHERE doc_id IN (SELECT id FROM docs WHERE user = ?)", (name,))
+                conn.execute("DELETE FROM docs WHERE user = ?", (name,))
+                for field in SEARCHABLE_FIELDS:
+                    stamps = timestamps.get(field, [])
+                    for pos, value in enumerate(profile.get(field, [])):
+                        self._add(conn, name, field, value, stamps[pos] if pos < len(stamps) else None)
+                conn.execute("INSERT OR IGNORE INTO indexed_users (name) VALUES (?)", (name,))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def search(self, query, name=None, limit=50):
+        """
+        Entries containing every word of `query`, newest first. Restricted to
+        one user when `name` is given.
+        """
+        tokens = sorted(tokenize(query))
+        if not tokens:
+            return []
+        placeholders = ",".join("?" * len(tokens))
+        sql = f"SELECT doc_id FROM postings WHERE token IN ({placeholders})"
+        args = list(tokens)
+        if name is not None:
+            sql += " AND user = ?"
+            args.append(name)
+        sql = (f"SELECT d.user, d.field, d.ts, d.body FROM docs d WHERE d.id IN "
+               f"({sql} GROUP BY doc_id HAVING COUNT(*) = ?) ORDER BY d.id DESC LIMIT ?")
+        rows = self._connect().execute(sql, (*args, len(tokens), limit)).fetchall()
+        return [
+            {"user": user, "field": field, "ts": ts, "entry": json.loads(body)}
+            for user, field, ts, body in rows
+        ]
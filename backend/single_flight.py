@@ -0,0 +1,128 @@
+import asyncio
+import functools
+import threading
+
+
+class _Call:
+    def __init__(self, task=None):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # Set when the leader is a coroutine on the async_runtime loop
+        self.task = task
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight calls: while a call for a key is running,
+    later callers with the same key wait for it and receive its result (or
+    its exception) instead of issuing their own upstream request. Nothing is
+    remembered once the call finishes; that is the response caches' job.
+
+    Blocking callers use do() and coroutines on the shared event loop use
+    do_async(); both share one table of in-flight calls, so a thread and a
+    coroutine asking for the same key also issue a single request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def join(self, key):
+        """
+        (call, leader) for `key`, for callers that answer several keys with one
+        request: a leader must settle the call with resolve(), a follower
+        waits for it with wait() or wait_async().
+        """
+        return self._join(key)
+
+    def resolve(self, key, call, result=None, error=None):
+        call.result, call.error = result, error
+        self._finish(key, call)
+
+    @staticmethod
+    def wait(call):
+        call.done.wait()
+        return call.outcome()
+
+    @staticmethod
+    async def wait_async(call):
+        if call.task is None:
+            # A blocking caller leads; wait for it without stalling the loop.
+            await asyncio.to_thread(call.done.wait)
+            return call.outcome()
+        # A cancelled waiter must not cancel the call the others share.
+        return await asyncio.shield(call.task)
+
+    def _join(self, key, task_factory=None):
+        """(call, leader) for `key`; a new async call starts its task under the lock."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            if task_factory is not None:
+                call.task = task_factory()
+                call.task.add_done_callback(lambda task: self._finish(key, call, task))
+            return call, True
+
+    def _finish(self, key, call, task=None):
+        if task is not None:
+            if task.cancelled():
+                call.error = asyncio.CancelledError()
+            elif task.exception() is not None:
+                call.error = task.exception()
+            else:
+                call.result = task.result()
+        with self._lock:
+            del self._calls[key]
+        call.done.set()
+
+    def do(self, key, fn):
+        call, leader = self._join(key)
+        if not leader:
+            return self.wait(call)
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+
+    async def do_async(self, key, factory):
+        call, _ = self._join(key, lambda: asyncio.ensure_future(factory()))
+        return await self.wait_async(call)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+flights = SingleFlight()
+
+
+def single_flight(group, key):
+    """
+    Decorator coalescing concurrent calls of a function or coroutine function
+    whose `key(*args, **kwargs)` match within `group`.
+    """
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                return await flights.do_async((group, key(*args, **kwargs)), lambda: fn(*args, **kwargs))
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                return flights.do((group, key(*args, **kwargs)), lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorate
@@ -0,0 +1,303 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from .journal_store import JournalStore
+from .history_dedup import split_entry, entry_refs, expand_entry
+from .history_query import entry_dates, normalize_date
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS medical_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    ts TEXT,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_medical_history_user ON medical_history (user, id);
+CREATE TABLE IF NOT EXISTS history_blobs (
+    hash TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS doctor_notes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    ts TEXT,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_doctor_notes_user ON doctor_notes (user, id);
+CREATE TABLE IF NOT EXISTS vitals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('bmi', 'height', 'bp')),
+    ts TEXT,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_vitals_user_kind ON vitals (user, kind, id);
+CREATE TABLE IF NOT EXISTS medications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    ts TEXT,
+    name TEXT NOT NULL,
+    time TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_medications_user ON medications (user, id);
+CREATE TABLE IF NOT EXISTS entry_dates (
+    user TEXT NOT NULL,
+    field TEXT NOT NULL,
+    date TEXT NOT NULL,
+    entry_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entry_dates ON entry_dates (user, field, date, entry_id);
+"""
+
+# field -> (table, extra WHERE clause, extra params) for single-column fields
+_FIELD_TABLES = {
+    "medical_history": ("medical_history", "", ()),
+    "doctor_notes": ("doctor_notes", "", ()),
+    "bmi": ("vitals", " AND kind = ?", ("bmi",)),
+    "height": ("vitals", " AND kind = ?", ("height",)),
+    "bp": ("vitals", " AND kind = ?", ("bp",)),
+}
+
+# Matches the dashboard's fallback when a medication has no stored time.
+DEFAULT_MEDICATION_TIME = "09:00"
+
+
+class SQLiteStore:
+    """
+    SQLite storage backend with one indexed table per profile list.
+
+    The database runs in WAL mode so many Streamlit sessions can read while one
+    writes. Users that only exist as legacy JSON/journal files are imported on
+    first access; other unknown names read as empty profiles and only get a
+    row on their first write. Medical history sub-records are stored once in
+    history_blobs, keyed by content hash.
+    """
+
+    def __init__(self, path="users/aletheia.db", legacy_root="users"):
+        self.path = path
+        self.legacy = JournalStore(legacy_root)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._blob_memo = {}
+        with self._write_lock:
+            self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _ensure_user(self, name, create=False):
+        """
+        True when `name` has a row, importing legacy files on first access.
+        Unknown users only get a row when `create` is set (i.e. on a write),
+        so reads never add users.
+        """
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM users WHERE name = ?", (name,)).fetchone():
+            return True
+        legacy = any(os.path.exists(path) for path in (self.legacy.snapshot_path(name), self.legacy.journal_path(name)))
+        if not legacy and not create:
+            return False
+        data = self.legacy.load(name)
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM users WHERE name = ?", (name,)).fetchone():
+                return True
+            conn.execute("INSERT INTO users (name) VALUES (?)", (name,))
+            pairs = [(field, value) for field in _FIELD_TABLES for value in data[field]]
+            times = data["medication_times"]
+            for i, med in enumerate(data["medications"]):
+                pairs.append(("medications", med))
+                if i < len(times):
+                    pairs.append(("medication_times", times[i]))
+            self._insert(conn, name, None, pairs)
+        return True
+
+    def _insert(self, conn, name, ts, pairs):
+        pending_med = None
+        for field, value in pairs:
+            if field == "medications":
+                if pending_med is not None:
+                    conn.execute(
+                        "INSERT INTO medications (user, ts, name, time) VALUES (?, ?, ?, NULL)",
+                        (name, ts, pending_med),
+                    )
+                pending_med = value
+            elif field == "medication_times":
+                conn.execute(
+                    "INSERT INTO medications (user, ts, name, time) VALUES (?, ?, ?, ?)",
+                    (name, ts, pending_med, value),
+                )
+                pending_med = None
+            elif field in ("bmi", "height", "bp"):
+                row = conn.execute(
+                    "INSERT INTO vitals (user, kind, ts, body) VALUES (?, ?, ?, ?)",
+                    (name, field, ts, json.dumps(value)),
+                )
+                self._index_dates(conn, name, field, row.lastrowid, value, ts)
+            elif field == "medical_history":
+                entry, blobs = split_entry(value)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO history_blobs (hash, body) VALUES (?, ?)",
+                    [(digest, json.dumps(blob)) for digest, blob in blobs.items() if digest not in self._blob_memo],
+                )
+                row = conn.execute(
+                    "INSERT INTO medical_history (user, ts, body) VALUES (?, ?, ?)",
+                    (name, ts, json.dumps(entry)),
+                )
+                self._index_dates(conn, name, field, row.lastrowid, value, ts)
+            elif field in _FIELD_TABLES:
+                row = conn.execute(
+                    f"INSERT INTO {field} (user, ts, body) VALUES (?, ?, ?)",
+                    (name, ts, json.dumps(value)),
+                )
+                self._index_dates(conn, name, field, row.lastrowid, value, ts)
+            else:
+                raise ValueError(f"Unknown profile field: {field}")
+        if pending_med is not None:
+            conn.execute(
+                "INSERT INTO medications (user, ts, name, time) VALUES (?, ?, ?, NULL)",
+                (name, ts, pending_med),
+            )
+
+    @staticmethod
+    def _index_dates(conn, name, field, entry_id, value, ts):
+        conn.executemany(
+            "INSERT INTO entry_dates (user, field, date, entry_id) VALUES (?, ?, ?, ?)",
+            [(name, field, date, entry_id) for date in entry_dates(field, value, ts)],
+        )
+
+    def append(self, name, pairs):
+        """Insert every (field, value) pair in `pairs` in one transaction."""
+        pairs = list(pairs)
+        if not pairs:
+            return
+        self._ensure_user(name, create=True)
+        with self._transaction() as conn:
+            self._insert(conn, name, datetime.now().isoformat(), pairs)
+            conn.execute("UPDATE users SET version = version + 1 WHERE name = ?", (name,))
+
+    def users(self):
+        """Names of every user in the database or still only on legacy files."""
+        rows = self._connect().execute("SELECT name FROM users").fetchall()
+        return sorted({row[0] for row in rows} | set(self.legacy.users()))
+
+    def _medications(self, name):
+        rows = self._connect().execute(
+            "SELECT name, time FROM medications WHERE user = ? ORDER BY id", (name,)
+        ).fetchall()
+        return [row[0] for row in rows], [row[1] or DEFAULT_MEDICATION_TIME for row in rows]
+
+    def stamp(self, name):
+        """
+        Change detector for writes from other processes: the user's version
+        counter, bumped in the same transaction as every append.
+        """
+        if not self._ensure_user(name):
+            return None
+        return self._connect().execute("SELECT version FROM users WHERE name = ?", (name,)).fetchone()[0]
+
+    def _expand(self, entries):
+        """Resolve history references, fetching only blobs not seen before."""
+        missing = list({h for entry in entries for h in entry_refs(entry) if h not in self._blob_memo})
+        conn = self._connect()
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            rows = conn.execute(
+                f"SELECT hash, body FROM history_blobs WHERE hash IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            # Blobs are immutable, so the memo never needs invalidating.
+            self._blob_memo.update((digest, json.loads(body)) for digest, body in rows)
+        return [expand_entry(entry, self._blob_memo) for entry in entries]
+
+    def _decode(self, field, rows):
+        entries = [json.loads(row[0]) for row in rows]
+        return self._expand(entries) if field == "medical_history" else entries
+
+    def read_field(self, name, field):
+        """Read one profile list with an indexed query on that field's table."""
+        self._ensure_user(name)
+        if field == "medications":
+            return self._medications(name)[0]
+        if field == "medication_times":
+            return self._medications(name)[1]
+        table, where, params = _FIELD_TABLES[field]
+        rows = self._connect().execute(
+            f"SELECT body FROM {table} WHERE user = ?{where} ORDER BY id", (name, *params)
+        ).fetchall()
+        return self._decode(field, rows)
+
+    def tail(self, name, field, n):
+        """Read the newest `n` entries of a field, oldest first."""
+        self._ensure_user(name)
+        if field in ("medications", "medication_times"):
+            return self.read_field(name, field)[-n:] if n > 0 else []
+        table, where, params = _FIELD_TABLES[field]
+        rows = self._connect().execute(
+            f"SELECT body FROM {table} WHERE user = ?{where} ORDER BY id DESC LIMIT ?",
+            (name, *params, n),
+        ).fetchall()
+        return self._decode(field, reversed(rows))
+
+    def page(self, name, field, cursor=None, limit=20, start=None, end=None):
+        """
+        Return (entries, next_cursor) for rows with id >= cursor, optionally
+        restricted to entries dated within [start, end] via idx_entry_dates.
+        """
+        self._ensure_user(name)
+        table, where, params = _FIELD_TABLES[field]
+        sql = f"SELECT id, body FROM {table} WHERE user = ?{where} AND id >= ?"
+        args = [name, *params, cursor or 0]
+        if start is not None or end is not None:
+            sql += (" AND id IN (SELECT entry_id FROM entry_dates"
+                    " WHERE user = ? AND field = ? AND date BETWEEN ? AND ?)")
+            args += [name, field, normalize_date(start) or "", normalize_date(end, upper=True) or "9999"]
+        sql += " ORDER BY id LIMIT ?"
+        rows = self._connect().execute(sql, (*args, limit + 1)).fetchall()
+        next_cursor = rows[limit][0] if len(rows) > limit else None
+        return self._decode(field, [(row[1],) for row in rows[:limit]]), next_cursor
+
+    def load(self, name):
+        """Assemble the full profile view from every table."""
+        data = {field: self.read_field(name, field) for field in _FIELD_TABLES}
+        data["medications"], data["medication_times"] = self._medications(name)
+        data["timestamps"] = {field: self._timestamps(name, field) for field in _FIELD_TABLES}
+        data["timestamps"]["medications"] = data["timestamps"]["medication_times"] = [
+            row[0] for row in self._connect().execute(
+                "SELECT ts FROM medications WHERE user = ? ORDER BY id", (name,)
+            )
+        ]
+        return data
+
+    def _timestamps(self, name, field):
+        table, where, params = _FIELD_TABLES[field]
+        rows = self._connect().execute(
+            f"SELECT ts FROM {table} WHERE user = ?{where} ORDER BY id", (name, *params)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def compact(self, name):
+        """Nothing to fold; SQLite checkpoints its WAL on its own."""
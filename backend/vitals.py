@@ -0,0 +1,192 @@
+import re
+import numpy as np
+
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_CM_RE = re.compile(r"(\d+(?:\.\d+)?)\s*cm", re.I)
+_FEET_RE = re.compile(r"(\d+)\s*(?:ft|feet|')\s*(?:(\d+(?:\.\d+)?)\s*(?:in|inches|\"|''))?", re.I)
+_BP_RE = re.compile(r"(\d{2,3})\s*/\s*(\d{2,3})")
+
+
+def _first_number(text):
+    match = _NUMBER_RE.search(text)
+    return float(match.group()) if match else np.nan
+
+
+def parse_bmi(text):
+    return (_first_number(text),)
+
+
+def parse_height(text):
+    """Height in cm from "180 cm", "5 ft 11 in (180 cm)", "5'11\"" or a bare number."""
+    match = _CM_RE.search(text)
+    if match:
+        return (float(match.group(1)),)
+    match = _FEET_RE.search(text)
+    if match:
+        return (int(match.group(1)) * 30.48 + float(match.group(2) or 0) * 2.54,)
+    return (_first_number(text),)
+
+
+def parse_bp(text):
+    """(systolic, diastolic) from "118/76 mmHg"."""
+    match = _BP_RE.search(text)
+    if not match:
+        return (np.nan, np.nan)
+    return (float(match.group(1)), float(match.group(2)))
+
+
+# profile field -> (chart label, column names, parser)
+VITALS = {
+    "bmi": ("BMI", ("BMI",), parse_bmi),
+    "height": ("Height", ("Height (cm)",), parse_height),
+    "bp": ("Blood Pressure", ("Systolic", "Diastolic"), parse_bp),
+}
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: indices of at most `threshold` points of
+    (x, y) that keep the visual shape of the line, including its peaks.
+    The first and last points are always kept.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    # Bucket i covers [edges[i], edges[i + 1]); the first and last points
+    # sit outside the buckets.
+    edges = np.floor(np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+class VitalSeries:
+    """
+    One vital sign in columnar form: a datetime64 timestamp array plus one
+    float64 array per column (bp is split into systolic/diastolic). Missing
+    or unparseable readings are NaN; unknown times are NaT.
+    """
+
+    def __init__(self, label, t, columns, latest, positions=None):
+        self.label = label
+        self.t = t
+        self.columns = columns
+        self.latest = latest
+        # Reading numbers in the full history (differs once downsampled).
+        self.positions = np.arange(len(t)) if positions is None else positions
+        self._frame = None
+
+    def __len__(self):
+        return len(self.t)
+
+    @classmethod
+    def from_values(cls, field, values, timestamps):
+        label, names, parse = VITALS[field]
+        rows = np.full((len(values), len(names)), np.nan)
+        t = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[s]")
+        for i, value in enumerate(values):
+            when = timestamps[i] if i < len(timestamps) else None
+            if isinstance(value, dict):
+                when = value.get("date") or when
+                value = value.get("value")
+            if value is not None:
+                rows[i] = parse(str(value))
+            if when:
+                # Parsed readings may carry non-string dates, e.g. 20240101
+                when = str(when)
+                if len(when) == 8 and when.isdigit():
+                    when = f"{when[:4]}-{when[4:6]}-{when[6:]}"
+                try:
+                    t[i] = np.datetime64(when[:19], "s")
+                except (ValueError, TypeError):
+                    pass
+        latest = values[-1].get("value") if values and isinstance(values[-1], dict) else (values[-1] if values else None)
+        return cls(label, t, {name: rows[:, j] for j, name in enumerate(names)}, latest)
+
+    @property
+    def dated(self):
+        """True when every reading has a timestamp."""
+        return len(self.t) > 0 and not np.isnat(self.t).any()
+
+    def x(self):
+        """Days since the first reading when dated, otherwise reading index."""
+        if self.dated:
+            return (self.t - self.t[0]).astype("timedelta64[s]").astype(np.float64) / 86400.0
+        return self.positions.astype(np.float64)
+
+    def rolling_mean(self, window=7):
+        """NaN-aware trailing mean over the last `window` readings."""
+        result = {}
+        for name, y in self.columns.items():
+            valid = ~np.isnan(y)
+            sums = np.cumsum(np.where(valid, y, 0.0))
+            counts = np.cumsum(valid)
+            sums[window:] = sums[window:] - sums[:-window]
+            counts[window:] = counts[window:] - counts[:-window]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result[name] = np.where(counts > 0, sums / counts, np.nan)
+        return result
+
+    def min(self):
+        return {name: float(np.nanmin(y)) if np.isfinite(y).any() else None for name, y in self.columns.items()}
+
+    def max(self):
+        return {name: float(np.nanmax(y)) if np.isfinite(y).any() else None for name, y in self.columns.items()}
+
+    def trend(self):
+        """Least-squares slope per day (or per reading when undated)."""
+        x = self.x()
+        result = {}
+        for name, y in self.columns.items():
+            valid = ~np.isnan(y)
+            if valid.sum() < 2 or np.ptp(x[valid]) == 0:
+                result[name] = None
+            else:
+                result[name] = float(np.polyfit(x[valid], y[valid], 1)[0])
+        return result
+
+    def downsample(self, max_points):
+        """
+        LTTB-downsampled copy for charting. The budget is shared between
+        columns and the union of each column's picks is kept, so both the
+        systolic and diastolic peaks survive.
+        """
+        if len(self) <= max_points:
+            return self
+        x = self.x()
+        keep = set()
+        budget = max(3, max_points // len(self.columns))
+        for y in self.columns.values():
+            valid = np.flatnonzero(~np.isnan(y))
+            keep.update(valid[lttb(x[valid], y[valid], budget)].tolist())
+        rows = np.array(sorted(keep), dtype=np.int64)
+        columns = {name: y[rows] for name, y in self.columns.items()}
+        return VitalSeries(self.label, self.t[rows], columns, self.latest, self.positions[rows])
+
+    def to_frame(self):
+        """Chart-ready DataFrame, built once per series."""
+        if self._frame is None:
+            import pandas as pd
+            index = pd.DatetimeIndex(self.t, name="date") if self.dated else pd.Index(self.positions, name="reading")
+            self._frame = pd.DataFrame(self.columns, index=index)
+        return self._frame
+
+
+def build_vitals(profile):
+    """Parse a profile's bmi/height/bp lists into {field: VitalSeries}."""
+    timestamps = profile.get("timestamps", {})
+    return {
+        field: VitalSeries.from_values(field, profile.get(field, []), timestamps.get(field, []))
+        for field in VITALS
+    }
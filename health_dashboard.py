@@ -2,16 +2,19 @@ import streamlit as st
 from datetime import datetime, time
 import json
 import os
+from concurrent.futures import as_completed
 from backend.user_data import (
     read_medical_history,
     write_medical_history,
     read_doctor_notes,
     append_doctor_notes
 )
-from backend.insurance_probe import analyze_insurance
+from backend.insurance_probe import analyze_insurance, build_context
+from backend import async_runtime
+from backend.prefetch import prefetch_medications
+from backend.ndc_index import lookup_ndc, ndc_index, building as ndc_index_building
 from backend.letta_calls import *
 from backend.general_history import *
-import pandas as pd
 from datetime import datetime
 
 def parse_time_string(tstr):
@@ -20,27 +23,6 @@ def parse_time_string(tstr):
     except Exception:
         return datetime.strptime(tstr, "%H:%M").time()  # fallback for 24h format
     
-def append_medication(name, medication, medication_time):
-    with open(f'users/{name}.json', 'r') as f:
-        data = json.load(f)
-    if 'medications' not in data:
-        data['medications'] = []
-    if 'medication_times' not in data:
-        data['medication_times'] = []
-    if medication:
-        # Convert time object to string if needed
-        if isinstance(medication_time, time):
-            med_time_str = medication_time.strftime("%H:%M")
-        else:
-            med_time_str = str(medication_time)
-        data['medications'].append(medication)
-        data['medication_times'].append(med_time_str)
-    with open(f'users/{name}.json', 'w') as f:
-        json.dump(data, f, indent=0)
-
-st.cache_data.clear()
-st.cache_resource.clear()
-
 st.set_page_config(page_title="Aletheia", layout="wide", initial_sidebar_state="expanded")
 
 # --- Modern CSS with Gradients and Glassmorphism ---
@@ -671,21 +653,23 @@ if st.session_state.tab == "dashboard":
                             st.session_state.uploaded_height = data.get("height", "")
                             st.session_state.uploaded_bp = data.get("bp", "")
                             st.session_state.first_name = full_name.split()[0] if full_name.strip() else "profile"
-                            append_doctor_notes(st.session_state.first_name, st.session_state.uploaded_doctors_note)
-                            write_medical_history(st.session_state.first_name, st.session_state.uploaded_medical_history)
-                            append_user_stats(st.session_state.first_name, st.session_state.uploaded_bmi, st.session_state.uploaded_height, st.session_state.uploaded_bp)
-                            # Add all medicines and medicine_times to user JSON
-                            medicines = data.get("medications", [])
-                            medicine_times = data.get("medication_times", [])
-                            print(medicines)
-                            print(medicine_times)
-                            for med, med_time_str in zip(medicines, medicine_times):
-                                try:
-                                    med_time = parse_time_string(med_time_str)
-                                except Exception:
-                                    med_time = time(9, 0)
-                                print(med, med_time)
-                                append_medication(st.session_state.first_name, med, med_time)
+                            # Apply every extracted record in one write
+                            with profile_batch(st.session_state.first_name) as batch:
+                                batch.append_doctor_notes(st.session_state.uploaded_doctors_note)
+                                batch.write_medical_history(st.session_state.uploaded_medical_history)
+                                batch.append_user_stats(st.session_state.uploaded_bmi, st.session_state.uploaded_height, st.session_state.uploaded_bp)
+                                # Add all medicines and medicine_times to user JSON
+                                medicines = data.get("medications", [])
+                                medicine_times = data.get("medication_times", [])
+                                print(medicines)
+                                print(medicine_times)
+                                for med, med_time_str in zip(medicines, medicine_times):
+                                    try:
+                                        med_time = parse_time_string(med_time_str)
+                                    except Exception:
+                                        med_time = time(9, 0)
+                                    print(med, med_time)
+                                    batch.append_medication(med, med_time)
                             st.success(f"✅ Document processed successfully!\n{data["summary"]}")
                         except Exception as e:
                             st.error(f"❌ Failed to parse document: {e}")
@@ -696,8 +680,7 @@ if st.session_state.tab == "dashboard":
 if not st.session_state.get("medications"):
     st.session_state.medications = []
     try:
-        with open(f'users/{st.session_state.first_name}.json', 'r') as f:
-            data = json.load(f)
+        data = read_profile(st.session_state.first_name)
         meds = data.get("medications", [])
         med_times = data.get("medication_times", [])
         for i, med in enumerate(meds):
@@ -708,6 +691,8 @@ if not st.session_state.get("medications"):
             })
     except Exception as e:
         st.warning(f"Could not load medications: {e}")
+    # Warm explanations and missed-dose advice while the user looks around
+    prefetch_medications(st.session_state.medications)
 
 # --- Dashboard Tab ---
 if st.session_state.tab == "dashboard":
@@ -722,33 +707,9 @@ if st.session_state.tab == "dashboard":
     # Health Metrics - Changed from Steps to BMI
     st.markdown("### 📊 Health Overview")
     st.title("🌸 Health Tracker Dashboard")
-    with open(f'users/{st.session_state.first_name}.json', 'r') as f:
-        data = json.load(f)
+    vitals = read_vitals_chart(st.session_state.first_name)
 
     col1, col2, col3 = st.columns(3)
-    # Prepare data for metrics and charts
-    bmi_values = data.get('bmi', [])
-    height_values = data.get('height', [])
-    bp_values = data.get('bp', [])
-
-    # Convert to DataFrame for plotting if possible
-    def to_df(values, label):
-        # Accepts list of dicts with 'value' and optional 'date', or just values
-        if not values:
-            return pd.DataFrame()
-        if isinstance(values[0], dict):
-            df = pd.DataFrame(values)
-            if 'date' in df.columns:
-                df = df.sort_values('date')
-            if 'value' in df.columns:
-                df = df.rename(columns={'value': label})
-            return df
-        else:
-            return pd.DataFrame({label: values})
-
-    bmi_df = to_df(bmi_values, 'BMI')
-    height_df = to_df(height_values, 'Height')
-    bp_df = to_df(bp_values, 'Blood Pressure')
 
     metric_style = """
     <style>
@@ -759,39 +720,16 @@ if st.session_state.tab == "dashboard":
     """
     st.markdown(metric_style, unsafe_allow_html=True)
 
-    with col1:
-        with st.container():
-            st.markdown('<div class="small-metric">', unsafe_allow_html=True)
-            latest_bmi = bmi_df['BMI'].iloc[-1] if not bmi_df.empty else "N/A"
-            st.metric("BMI", latest_bmi)
-            st.markdown('</div>', unsafe_allow_html=True)
-        if not bmi_df.empty:
-            st.line_chart(
-                bmi_df.set_index('date') if 'date' in bmi_df.columns else bmi_df,
-                height=180,
-            )
-    with col2:
-        with st.container():
-            st.markdown('<div class="small-metric">', unsafe_allow_html=True)
-            latest_height = height_df['Height'].iloc[-1] if not height_df.empty else "N/A"
-            st.metric("Height", latest_height)
-            st.markdown('</div>', unsafe_allow_html=True)
-        if not height_df.empty:
-            st.line_chart(
-                height_df.set_index('date') if 'date' in height_df.columns else height_df,
-                height=180,
-            )
-    with col3:
-        with st.container():
-            st.markdown('<div class="small-metric">', unsafe_allow_html=True)
-            latest_bp = bp_df['Blood Pressure'].iloc[-1] if not bp_df.empty else "N/A"
-            st.metric("Blood Pressure", latest_bp)
-            st.markdown('</div>', unsafe_allow_html=True)
-        if not bp_df.empty:
-            st.line_chart(
-                bp_df.set_index('date') if 'date' in bp_df.columns else bp_df,
-                height=180,
-            )
+    # Series are parsed and downsampled once per profile change and shared across reruns
+    for column, field in zip((col1, col2, col3), ("bmi", "height", "bp")):
+        series = vitals[field]
+        with column:
+            with st.container():
+                st.markdown('<div class="small-metric">', unsafe_allow_html=True)
+                st.metric(series.label, series.latest if len(series) else "N/A")
+                st.markdown('</div>', unsafe_allow_html=True)
+            if len(series):
+                st.line_chart(series.to_frame(), height=180)
 
     st.markdown("---")
 
@@ -893,6 +831,8 @@ if st.session_state.tab == "dashboard":
                 # Only generate explanation if not already cached
                 explanation_key = f"explanation_{i}_{med['name']}"
                 if explanation_key not in st.session_state:
+                    # The whole schedule is explained in one background batch (prefetch_medications);
+                    # while it runs, this waits for its answer instead of asking again
                     raw_response = medicine_explainer.medicine_explainer(med["name"])
                     
                     # Debug: Show what we received
@@ -972,10 +912,21 @@ if st.session_state.tab == "dashboard":
                     # Cache AI response to prevent repeated calls
                     advice_key = f"advice_{i}_{med['name']}_{user_question}"
                     if advice_key not in st.session_state:
-                        if user_question.strip():
-                            raw_advice = conversation.conversation(f"I missed my {med['name']}. {user_question}")
-                        else:
-                            raw_advice = conversation.conversation(f"I missed my {med['name']}. What should I do?")
+                        # The default question is usually prefetched in the background
+                        raw_advice = None if user_question.strip() else advice_cache.get(med['name'])
+                        if raw_advice is None:
+                            # Render the reply as it streams in, then swap in the cleaned text below;
+                            # a streamed answer to the default question is cached for everyone
+                            if user_question.strip():
+                                chunks = conversation.conversation_stream(
+                                    conversation.missed_dose_query(med['name'], user_question)
+                                )
+                            else:
+                                chunks = conversation.missed_dose_advice_stream(med['name'])
+                            stream_slot = st.empty()
+                            with stream_slot.container():
+                                raw_advice = st.write_stream(chunks)
+                            stream_slot.empty()
                         
                         # Parse JSON response and extract only the "response" field
                         cleaned_advice = raw_advice
@@ -1065,7 +1016,7 @@ if st.session_state.tab == "dashboard":
                 st.session_state[f"taken_{len(st.session_state.medications) - 1}"] = False
                 st.session_state.new_med_name = ""
                 # --- Add to JSON file ---
-                append_medication_to_json(st.session_state.first_name, name, st.session_state.new_med_time)
+                append_medication(st.session_state.first_name, name, st.session_state.new_med_time)
                 st.success("✅ Medication added successfully!")
                 st.rerun()
 
@@ -1092,9 +1043,8 @@ if st.session_state.tab == "dashboard":
             <h4 style="margin-bottom: 1rem;">📚 Latest Medical History</h4>
         """, unsafe_allow_html=True)
         
-        med_hist = read_medical_history(st.session_state.get('first_name', st.session_state.profile.get('full_name', 'profile')))
-        if med_hist and len(med_hist) > 0:
-            latest_entry = med_hist[-1]
+        latest_entry = read_latest_medical_history(st.session_state.get('first_name', st.session_state.profile.get('full_name', 'profile')))
+        if latest_entry is not None:
             st.markdown(f"""
             <div style="background: rgba(255,255,255,0.7); border-radius: 12px; padding: 1rem; margin-bottom: 1rem; border-left: 4px solid var(--primary-pink);">
                 <strong>Latest Entry:</strong><br>
@@ -1120,9 +1070,8 @@ if st.session_state.tab == "dashboard":
                 <h4 style="margin-bottom: 1rem;">👩‍⚕️ Doctor's Notes</h4>
             """, unsafe_allow_html=True)
             
-            doc_notes = read_doctor_notes(st.session_state.get('first_name', st.session_state.profile.get('full_name', 'profile')))
-            if doc_notes and len(doc_notes) > 0:
-                latest_note = doc_notes[-1]
+            latest_note = read_latest_doctor_note(st.session_state.get('first_name', st.session_state.profile.get('full_name', 'profile')))
+            if latest_note is not None:
                 st.markdown(f"""
                 <div style="background: rgba(255,255,255,0.7); border-radius: 12px; padding: 1rem; margin-bottom: 1rem; border-left: 4px solid var(--primary-pink);">
                     <strong>Latest Note:</strong><br>
@@ -1178,41 +1127,13 @@ elif st.session_state.tab == "insurance":
     insurance_data = None
 
     if run_analysis and provider.strip():
-        # Clear any previous analysis data to prevent cache issues
-        if "insurance_analysis_cache" in st.session_state:
-            del st.session_state["insurance_analysis_cache"]
-        
         with st.spinner("🔍 Running comprehensive insurance analysis..."):
             # Create unique context for this specific provider
-            context = (
-                f"User is requesting analysis for {provider} insurance company. "
-                "User is a 32-year-old freelance graphic designer living in Los Angeles, earning "
-                "≈ $85k/year pre-tax with irregular cash-flow, mild asthma, type-2 diabetes family "
-                "history, newly married and planning children in ≤ 3 yrs. Needs PPO that covers "
-                "Cedars-Sinai + UCLA, strong maternity, fears high deductibles after a $4k ER bill, "
-                "values ESG & companies with clean denial records, wants first-class mobile app, "
-                "travels abroad ~6×/yr. Please analyze specifically {provider} and provide alternatives."
-            )
+            context = build_context(provider.strip())
             try:
-                # Force fresh analysis by passing clear provider name
+                # Served from the shared analysis cache when still fresh;
+                # fresh results are saved under backend/ by analyze_insurance
                 insurance_data = analyze_insurance(provider.strip(), context)
-                
-                # Save analysis with timestamp and provider name for debugging
-                analysis_filename = f"backend/insurance_analysis_{provider.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-                with open(analysis_filename, "w", encoding="utf-8") as f:
-                    json.dump({
-                        "provider": provider,
-                        "timestamp": datetime.now().isoformat(),
-                        "analysis": insurance_data
-                    }, f, ensure_ascii=False, indent=4)
-                    
-                # Also save to the main output file
-                with open("backend/insurance_analysis_output.json", "w", encoding="utf-8") as f:
-                    json.dump({
-                        "provider": provider,
-                        "timestamp": datetime.now().isoformat(),
-                        "analysis": insurance_data
-                    }, f, ensure_ascii=False, indent=4)
                     
                 st.success(f"✅ Analysis complete for {provider}!")
                 
@@ -1398,14 +1319,36 @@ elif st.session_state.tab == "scan":
             help="Take a clear photo of your pill or medication bottle"
         )
         
+        ndc_input = st.text_input("🔢 Or enter an NDC code", placeholder="e.g. 0573-0164-40")
+        if ndc_input.strip():
+            # Resolved from the local FDA NDC Directory, no model call
+            product = lookup_ndc(ndc_input)
+            if product:
+                st.success(f"✅ {product['brand_name'] or product['generic_name']} ({product['generic_name']})")
+                st.markdown(
+                    f"**NDC:** {product.get('package_ndc') or product['product_ndc']}  \n"
+                    f"**Form:** {product['dosage_form']} ({product['route']})  \n"
+                    f"**Ingredients:** {', '.join(product['ingredients'])}  \n"
+                    f"**Manufacturer:** {product['manufacturer']}"
+                    + (f"  \n**Package:** {product['package_description']}" if product.get("package_description") else "")
+                )
+            elif ndc_index() is None:
+                if ndc_index_building():
+                    st.info("⏳ The offline NDC directory is still being built; try again in a minute.")
+                else:
+                    st.info("The offline NDC directory is not installed (see backend/ndc_index.py).")
+            else:
+                st.warning("⚠️ No FDA NDC Directory entry for that code.")
+
         if image:
             st.image(image, caption="Uploaded medication image", use_column_width=True)
             
+            rescan = st.checkbox("🔄 Read the label again (ignore earlier scans)", key="rescan_label")
             # Only process when analyze button is clicked
             if st.button("🔍 Analyze Image", use_container_width=True):
                 with st.spinner("🔍 Analyzing medication..."):
                     try:
-                        raw_response = pill_identifier.pill_identifier(image)
+                        raw_response = pill_identifier.pill_identifier(image, refresh=rescan)
                         
                         # Parse JSON response and extract only the "response" field for medication name
                         medication_name = raw_response
@@ -1452,65 +1395,37 @@ elif st.session_state.tab == "scan":
                         </div>
                         """, unsafe_allow_html=True)
                         
-                        # Get detailed analysis
-                        with st.spinner("📋 Getting detailed information..."):
-                            raw_analysis = pill_identifier.pill_explainer(medication_name)
-                            pricing_info = pill_identifier.find_cheapest_price(medication_name)
-                            
-                            try:
-                                parsed_analysis = json.loads(raw_analysis)
-                                analysis = parsed_analysis['summary']
-                            except: 
-                                analysis = raw_analysis
-
-                            if pricing_info:
-                                analysis += f"\n\n** Pricing Information:**\nLink to buy: {pricing_info['link']}\nPrice: ${pricing_info['price']}"
-
-                            # raw_analysis = medicine_explainer.medicine_explainer(medication_name)
-                            
-                            # # Parse JSON response and extract only the "response" field for analysis
-                            # analysis = raw_analysis
-                            # try:
-                            #     # Handle string responses that might be JSON
-                            #     if isinstance(raw_analysis, str):
-                            #         # Try to parse as JSON
-                            #         if raw_analysis.strip().startswith('{') and raw_analysis.strip().endswith('}'):
-                            #             parsed_analysis = json.loads(raw_analysis)
-                            #             analysis = parsed_analysis.get("response", raw_analysis)
-                            #         else:
-                            #             # Not JSON, use as is
-                            #             analysis = raw_analysis
-                            #     # Handle dict responses
-                            #     elif isinstance(raw_analysis, dict):
-                            #         analysis = raw_analysis.get("response", str(raw_analysis))
-                            #     else:
-                            #         # Other types, convert to string
-                            #         analysis = str(raw_analysis)
-                                    
-                            # except (json.JSONDecodeError, AttributeError) as e:
-                            #     # If parsing fails, try manual extraction
-                            #     if isinstance(raw_analysis, str) and '"response":' in raw_analysis:
-                            #         try:
-                            #             start = raw_analysis.find('"response":"') + 12
-                            #             end = raw_analysis.find('","', start)
-                            #             if end == -1:
-                            #                 end = raw_analysis.find('"}', start)
-                            #             if start > 11 and end > start:
-                            #                 analysis = raw_analysis[start:end].replace('\\"', '"')
-                            #             else:
-                            #                 analysis = raw_analysis
-                            #         except:
-                            #             analysis = raw_analysis
-                            #     else:
-                            #         analysis = raw_analysis
-                            
-                            st.markdown("### 📋 Medication Information")
-                            st.markdown(f"""
-                            <div style="background: rgba(255, 255, 255, 0.1); border-radius: 15px; 
-                                        padding: 1.5rem; margin: 1rem 0;">
-                                {analysis}
-                            </div>
-                            """, unsafe_allow_html=True)
+                        # Explanation and price lookup are independent remote calls:
+                        # run both on the shared loop and render each as it lands.
+                        st.markdown("### 📋 Medication Information")
+                        info_slot = st.empty()
+                        price_slot = st.empty()
+                        info_slot.info("📋 Getting detailed information...")
+                        price_slot.info("💲 Looking up prices...")
+                        futures = {
+                            async_runtime.submit(pill_identifier.pill_explainer_async(medication_name)): "analysis",
+                            async_runtime.submit(pill_identifier.find_cheapest_price_async(medication_name)): "pricing",
+                        }
+                        for future in as_completed(futures):
+                            if futures[future] == "analysis":
+                                raw_analysis = future.result()
+                                try:
+                                    parsed_analysis = json.loads(raw_analysis)
+                                    analysis = parsed_analysis['summary']
+                                except: 
+                                    analysis = raw_analysis
+                                info_slot.markdown(f"""
+                                <div style="background: rgba(255, 255, 255, 0.1); border-radius: 15px; 
+                                            padding: 1.5rem; margin: 1rem 0;">
+                                    {analysis}
+                                </div>
+                                """, unsafe_allow_html=True)
+                            else:
+                                pricing_info = future.result()
+                                if pricing_info and "error" not in pricing_info:
+                                    price_slot.markdown(f"**Pricing Information:**\n\nLink to buy: {pricing_info.get('link')}\n\nPrice: ${pricing_info.get('price')}")
+                                else:
+                                    price_slot.warning("Pricing information is unavailable right now.")
                             
                     except Exception as e:
                         st.error(f"❌ Failed to analyze image: {e}")
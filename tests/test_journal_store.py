@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from backend import journal_store
+from backend.journal_store import JournalStore
+
+
+class InterruptedCompactionTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = JournalStore(self.dir.name)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def crash_before_journal_reset(self, name):
+        """compact() that dies after the snapshot is written, before the journal is reset."""
+        write = journal_store._atomic_write
+
+        def fail_on_journal(path, text):
+            if path == self.store.journal_path(name):
+                raise OSError("simulated crash")
+            write(path, text)
+
+        with mock.patch.object(journal_store, "_atomic_write", fail_on_journal):
+            with self.assertRaises(OSError):
+                self.store.compact(name)
+
+    def test_append_after_interrupted_compaction_is_kept(self):
+        self.store.append("u", [("doctor_notes", "a")])
+        self.crash_before_journal_reset("u")
+
+        self.store.append("u", [("doctor_notes", "b")])
+        self.assertEqual(self.store.load("u")["doctor_notes"], ["a", "b"])
+        self.assertEqual(self.store.tail("u", "doctor_notes", 1), ["b"])
+        self.assertEqual(JournalStore(self.dir.name).load("u")["doctor_notes"], ["a", "b"])
+
+        self.store.compact("u")
+        self.assertEqual(self.store.load("u")["doctor_notes"], ["a", "b"])
+
+    def test_interrupted_compaction_loses_nothing_on_read(self):
+        self.store.append("u", [("bmi", 21), ("doctor_notes", "a")])
+        self.crash_before_journal_reset("u")
+        self.assertTrue(os.path.exists(self.store.journal_path("u")))
+        self.assertEqual(self.store.load("u")["bmi"], [21])
+        self.assertEqual(self.store.tail("u", "doctor_notes", 5), ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()